@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+class LRUCache(object):
+    """
+        A mapping that keeps at most a given number (or total weight) of items, evicting the least recently used ones.
+        Keeps counts of hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize=None, thread_safe=False, weigh=None):
+        """
+            Creates a new cache.
+
+            maxsize: Maximal number (or total weight) of items to keep. If None, the cache is unbounded.
+            thread_safe: If set to True, guard all accesses by a lock so the cache can be shared across threads. Defaults to False.
+            weigh: Optional. Function returning the weight of a value, e.g. its size in bytes. Defaults to a weight of 1 per item.
+        """
+
+        self.maxsize = maxsize
+        self.thread_safe = thread_safe
+
+        self.weigh = weigh
+        self.weight = 0
+
+        self._items = OrderedDict()
+        self._lock = threading.Lock() if thread_safe else nullcontext()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+            Returns the item stored for a key and marks it as recently used, or default if there is none.
+
+            key: Key to look up.
+            default: Value to return when the key is not cached. Defaults to None.
+        """
+
+        with self._lock:
+            # without a lock, another thread may evict the key at any point
+            try:
+                value = self._items[key]
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            old = self._items.pop(key, _missing)
+            if old is not _missing:
+                self.weight -= self._weigh(old)
+
+            self._items[key] = value
+            self.weight += self._weigh(value)
+
+            # evict the least recently used items
+            if self.maxsize != None:
+                while self._total_weight() > self.maxsize and self._items:
+                    try:
+                        (_, evicted) = self._items.popitem(last=False)
+                    except KeyError:
+                        # another thread emptied the cache in the meantime
+                        break
+
+                    self.weight -= self._weigh(evicted)
+                    self.evictions += 1
+
+            # without a lock, concurrent updates may have left the weight out of date
+            self.weight = self._total_weight() if self._items else 0
+
+    def _weigh(self, value):
+        return 1 if self.weigh == None else self.weigh(value)
+
+    def _total_weight(self):
+        """
+            Returns the total weight of all items. Unweighted items are counted directly, so that races without a lock can not make it drift.
+        """
+
+        return len(self._items) if self.weigh == None else self.weight
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def items(self):
+        """
+            Returns a list of all (key, value) pairs, least recently used first.
+        """
+
+        with self._lock:
+            return list(self._items.items())
+
+    def clear(self):
+        """
+            Removes all items from the cache. Statistics are kept.
+        """
+
+        with self._lock:
+            self._items.clear()
+            self.weight = 0
+
+    def stats(self):
+        """
+            Returns a dict of cache statistics: hits, misses, evictions, size, weight and maxsize.
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._items),
+                "weight": self.weight,
+                "maxsize": self.maxsize
+            }
+
+    def reset_stats(self):
+        """
+            Resets the hit, miss and eviction counters.
+        """
+
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+# marker for items not found in a cache
+_missing = object()
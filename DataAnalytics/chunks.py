@@ -0,0 +1,32 @@
+import numpy as np
+import scipy.sparse
+
+def _row_chunks(M, chunk_size):
+    """
+        Iterates over chunks of rows.
+
+        M: Matrix (possibly sparse or memory-mapped) to slice into chunks of at most chunk_size rows, or an iterable of chunks to pass through.
+        chunk_size: Maximal number of rows per chunk of a matrix.
+    """
+
+    if not hasattr(M, 'shape'):
+        yield from M
+        return
+
+    for start in range(0, M.shape[0], chunk_size):
+        yield M[start:start + chunk_size]
+
+def _stack_rows(chunks):
+    """
+        Stacks chunks of rows into one matrix.
+
+        chunks: List of chunks. Either all dense or all sparse.
+    """
+
+    if len(chunks) == 1:
+        return chunks[0]
+
+    if scipy.sparse.issparse(chunks[0]):
+        return scipy.sparse.vstack(chunks, format='csr')
+
+    return np.vstack(chunks)
@@ -1,4 +1,15 @@
+import time
+import numpy as np
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from threadpoolctl import threadpool_limits
 from sklearn import cluster
+from sklearn.neighbors import NearestNeighbors
+
+from DataAnalytics.distances import CondensedDistanceMatrix
+from DataAnalytics.chunks import _row_chunks, _stack_rows
+from DataAnalytics.jobs import _n_jobs
 
 def k_means(M, k, seed=None):
     """
@@ -13,15 +24,297 @@ def k_means(M, k, seed=None):
     k_means_obj = cluster.KMeans(n_clusters=k, n_init=1, max_iter=300, tol=1e-4, random_state=seed)
     return k_means_obj.fit_predict(M)
 
+def k_means_sweep(M, ks, seeds=(0,), n_jobs=1):
+    """
+        Computes a k-means clustering for every combination of several numbers of clusters and seeds, in parallel processes.
+        The processes share one read-only copy of M.
+        Returns a pair (runs, best), where runs is a list of dicts with keys k, seed, labels, inertia and time (in seconds) for each combination,
+        and best maps each k to the run with the smallest inertia.
+
+        M: matrix to use. May be sparse.
+        ks: numbers of clusters to find.
+        seeds: Random number generator seeds to use for each k. Defaults to (0,).
+        n_jobs: Number of processes to run in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+    """
+
+    n_jobs = _n_jobs(n_jobs)
+
+    settings = [(k, seed) for k in ks for seed in seeds]
+
+    if n_jobs == 1 or len(settings) <= 1:
+        results = [_k_means_run(M, k, seed) for (k, seed) in settings]
+    else:
+        # copy M into shared memory once, instead of pickling it for every run
+        if scipy.sparse.issparse(M):
+            M = scipy.sparse.csr_matrix(M)
+            (blocks, specs) = _share_arrays([M.data, M.indices, M.indptr])
+            shape = M.shape
+        else:
+            (blocks, specs) = _share_arrays([np.asarray(M)])
+            shape = None
+
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared, initargs=(specs, shape)) as pool:
+                results = list(pool.map(_k_means_shared_run, settings))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    runs = [{"k": k, "seed": seed, "labels": labels, "inertia": inertia, "time": t} for ((k, seed), (labels, inertia, t)) in zip(settings, results)]
+
+    # find the best run for each k
+    best = {}
+    for run in runs:
+        if not run["k"] in best or run["inertia"] < best[run["k"]]["inertia"]:
+            best[run["k"]] = run
+
+    return (runs, best)
+
+def _k_means_run(M, k, seed):
+    """
+        Computes one k-means clustering as in k_means.
+        Returns a tuple of the labels, the inertia and the time it took.
+
+        M: matrix to use
+        k: number of clusters to find.
+        seed: Random number generator seed to use.
+    """
+
+    start = time.perf_counter()
+
+    k_means_obj = cluster.KMeans(n_clusters=k, n_init=1, max_iter=300, tol=1e-4, random_state=seed)
+    labels = k_means_obj.fit_predict(M)
+
+    return (labels, k_means_obj.inertia_, time.perf_counter() - start)
+
+def _share_arrays(arrays):
+    """
+        Copies arrays into new blocks of shared memory.
+        Returns a pair of the blocks and the specs to attach to them with _attach_shared.
+
+        arrays: List of arrays to copy.
+    """
+
+    blocks = []
+    specs = []
+
+    for A in arrays:
+        A = np.ascontiguousarray(A)
+        block = shared_memory.SharedMemory(create=True, size=max(A.nbytes, 1))
+        np.ndarray(A.shape, dtype=A.dtype, buffer=block.buf)[...] = A
+
+        blocks.append(block)
+        specs.append((block.name, A.shape, A.dtype.str))
+
+    return (blocks, specs)
+
+# matrix shared with a worker process, and what keeps it alive
+_shared_M = None
+_shared_state = None
+
+def _attach_shared(specs, shape):
+    """
+        Initializes a worker process of k_means_sweep with the shared matrix.
+
+        specs: Specs of the shared arrays as returned by _share_arrays.
+        shape: Shape of the sparse matrix made up by the arrays, or None if there is a single dense array.
+    """
+
+    global _shared_M, _shared_state
+
+    blocks = [shared_memory.SharedMemory(name=name) for (name, _, _) in specs]
+    arrays = [np.ndarray(a_shape, dtype=dtype, buffer=block.buf) for (block, (_, a_shape, dtype)) in zip(blocks, specs)]
+
+    for A in arrays:
+        A.flags.writeable = False
+
+    if shape == None:
+        _shared_M = arrays[0]
+    else:
+        _shared_M = scipy.sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+    # one thread per process, as the processes already use all cores
+    _shared_state = (blocks, threadpool_limits(limits=1))
+
+def _k_means_shared_run(setting):
+    """
+        Computes one k-means clustering of the shared matrix in a worker process.
+
+        setting: Pair of number of clusters and seed.
+    """
+
+    (k, seed) = setting
+    return _k_means_run(_shared_M, k, seed)
+
+def mini_batch_k_means(M, k, batch_size=1024, n_epochs=1, seed=None):
+    """
+        Computes a k-means clustering using mini-batches, which is much faster than k_means on large matrices.
+        Returns the labels of all rows.
+
+        M: matrix to use. May be sparse or memory-mapped.
+        k: number of clusters to find.
+        batch_size: Number of rows to update the centers with at a time. Defaults to 1024.
+        n_epochs: Number of passes over M. Defaults to 1.
+        seed: Random number generator seed to use. Optional.
+    """
+
+    return StreamingKMeans(k, batch_size=batch_size, seed=seed).fit(M, n_epochs=n_epochs).predict(M)
+
+class StreamingKMeans(object):
+    """
+        A k-means clustering that is updated one chunk of rows at a time, so that it never needs all rows in memory.
+        Once fitted, labels new rows without refitting.
+    """
+
+    def __init__(self, k, batch_size=1024, seed=None):
+        """
+            Creates a new, unfitted clustering.
+
+            k: number of clusters to find.
+            batch_size: Number of rows to update the centers with at a time. Defaults to 1024.
+            seed: Random number generator seed to use. Optional.
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.k = k
+        self.batch_size = batch_size
+        self.seed = seed
+
+        self.model = cluster.MiniBatchKMeans(n_clusters=k, batch_size=batch_size, compute_labels=False, random_state=seed)
+
+        # rows seen before there are enough of them to place the initial centers
+        self._pending = []
+        self._fitted = False
+
+    @property
+    def centers(self):
+        """
+            Matrix of cluster centers, one per row.
+        """
+
+        return self.model.cluster_centers_
+
+    def partial_fit(self, M):
+        """
+            Updates the centers with a chunk of rows.
+            Returns this clustering.
+
+            M: Chunk of rows. May be sparse.
+        """
+
+        # wait for enough rows to place the initial centers
+        if not self._fitted:
+            self._pending.append(M)
+            if sum(P.shape[0] for P in self._pending) < self.k:
+                return self
+
+            M = _stack_rows(self._pending)
+            self._pending = []
+            self._fitted = True
+
+            # the first batch places the initial centers, so it needs at least k rows
+            first = max(self.batch_size, self.k)
+            self.model.partial_fit(M[:first])
+            M = M[first:]
+
+        for batch in _row_chunks(M, self.batch_size):
+            self.model.partial_fit(batch)
+
+        return self
+
+    def fit(self, M, n_epochs=1):
+        """
+            Updates the centers with all rows of a matrix or all chunks of an iterator.
+            Returns this clustering.
+
+            M: Matrix (possibly sparse or memory-mapped), or iterable of chunks of rows.
+            n_epochs: Number of passes over M. Ignored for iterables, which are only passed over once. Defaults to 1.
+        """
+
+        if not hasattr(M, 'shape'):
+            for chunk in M:
+                self.partial_fit(chunk)
+            return self
+
+        # visit batches in random order, in case rows are sorted in some way
+        rng = np.random.default_rng(self.seed)
+        starts = np.arange(0, M.shape[0], self.batch_size)
+
+        for _ in range(n_epochs):
+            for start in rng.permutation(starts):
+                self.partial_fit(M[start:start + self.batch_size])
+
+        return self
+
+    def predict(self, M, chunk_size=65536):
+        """
+            Returns the labels of the closest centers to rows.
+
+            M: Matrix (possibly sparse or memory-mapped), or iterable of chunks of rows.
+            chunk_size: Number of rows of a matrix to label at a time. Defaults to 65536.
+        """
+
+        labels = [self.model.predict(chunk) for chunk in _row_chunks(M, chunk_size)]
+        return np.concatenate(labels) if labels else np.zeros(0, dtype=np.int32)
+
 def DBSCAN(M, eps=0.5, min_pts=5, d='euclidean'):
     """
         Performs DBSCAN clustering.
 
-        M: matrix to use
+        M: matrix to use, or a CondensedDistanceMatrix of precomputed distances.
         eps: Epsilon for DBSCAN algorithm, Neighbourhood to find points in
         min_pts: Threshold to consider neighbourhood dense.
-        d: Distance metric to use.
+        d: Distance metric to use. Ignored for a CondensedDistanceMatrix.
     """
 
+    # only pass on the distances within the neighbourhood
+    if isinstance(M, CondensedDistanceMatrix):
+        (M, d) = (M.radius_graph(eps), 'precomputed')
+
     dbscan_obj = cluster.DBSCAN(eps=eps, min_samples=min_pts, metric=d)
     return dbscan_obj.fit_predict(M)
+
+def DBSCAN_sweep(M, eps, min_pts=5, d='euclidean', n_jobs=1):
+    """
+        Performs DBSCAN clustering for every combination of several values of eps and min_pts.
+        Neighbourhoods are found only once, at the largest eps, using a spatial index, and are then filtered for each smaller eps.
+        Memory use is proportional to the number of neighbouring pairs rather than the square of the number of rows.
+        Returns a dict mapping each pair (eps, min_pts) to the labels of that clustering.
+
+        M: matrix to use, a CondensedDistanceMatrix of precomputed distances, or a sparse matrix of precomputed distances within the largest eps (with d='precomputed').
+        eps: Value or list of values of epsilon for DBSCAN algorithm.
+        min_pts: Value or list of values of the threshold to consider neighbourhood dense. Defaults to 5.
+        d: Distance metric to use. Ignored for a CondensedDistanceMatrix.
+        n_jobs: Number of threads to find neighbourhoods in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+    """
+
+    eps = np.atleast_1d(eps).tolist()
+    min_pts = np.atleast_1d(min_pts).tolist()
+
+    # build the graph of all neighbourhoods once
+    if isinstance(M, CondensedDistanceMatrix):
+        graph = M.radius_graph(max(eps))
+    elif d == 'precomputed' and scipy.sparse.issparse(M):
+        graph = scipy.sparse.csr_matrix(M)
+    else:
+        nn = NearestNeighbors(radius=max(eps), metric=d, n_jobs=_n_jobs(n_jobs)).fit(M)
+        graph = nn.radius_neighbors_graph(mode='distance')
+
+    labels = {}
+
+    for e in sorted(eps, reverse=True):
+        # drop the edges that are too long, keeping explicit zeros for duplicate elements
+        keep = graph.data <= e
+        if not np.all(keep):
+            rows = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=graph.shape[0]))))
+            graph = scipy.sparse.csr_matrix((graph.data[keep], graph.indices[keep], indptr), shape=graph.shape)
+
+        for m in min_pts:
+            dbscan_obj = cluster.DBSCAN(eps=e, min_samples=m, metric='precomputed')
+            labels[(e, m)] = dbscan_obj.fit_predict(graph)
+
+    return labels
@@ -1,48 +1,244 @@
+import os
+import hashlib
+import threading
 import numpy as np
-from scipy.spatial.distance import pdist, cdist, cosine, squareform
+import scipy.sparse
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial.distance import pdist, cdist, squareform
 
-def order_by_distance(v, A, d=None):
+from DataAnalytics.cache import LRUCache
+from DataAnalytics.jobs import _n_jobs
+
+def order_by_distance(v, A, d=None, k=None):
     """
         Returns a list of indexes sorted by distance to a vector.
 
         v: Vector to compute distance from
-        A: List of vectors (matrix) to compute distacnes from.
-        d: Distance Function (metric) to use. Defaults to cosine.
+        A: List of vectors (matrix) to compute distacnes from. May be sparse.
+        d: Distance Function (metric) to use. Either the name of a metric understood by scipy.spatial.distance.cdist or a function. Defaults to cosine.
+        k: Optional. If given, only return the indexes of the k closest vectors.
     """
 
-    # default to the cosine matrix
-    if d == None:
-        d = cosine
-
     # compute distances
-    distances = [d(v, a) for a in A]
+    if d == None or isinstance(d, str):
+        distances = distance_to_all(v, A, 'cosine' if d == None else d)
+    elif scipy.sparse.issparse(A):
+        A = scipy.sparse.csr_matrix(A)
+        distances = [d(v, A.getrow(i).toarray().ravel()) for i in range(A.shape[0])]
+    else:
+        distances = [d(v, a) for a in A]
 
     # and sort by it
-    return np.argsort(distances)
+    if k == None:
+        return np.argsort(distances)
+    else:
+        return _top_k(np.asarray(distances), k)[0]
+
+def distance_to_all(v, A, d='cosine'):
+    """
+        Computes the distances from a vector to each row of a matrix in one go.
+
+        v: Vector to compute distance from
+        A: List of vectors (matrix) to compute distacnes from. May be sparse.
+        d: Name of distance metric understood by scipy.spatial.distance.cdist. Defaults to 'cosine'.
+    """
+
+    # turn v into a flat dense vector
+    if scipy.sparse.issparse(v):
+        v = v.toarray()
+    v = np.asarray(v, dtype=float).ravel()
+
+    # turn A into a matrix with one row per vector
+    if scipy.sparse.issparse(A):
+        A = scipy.sparse.csr_matrix(A)
+    else:
+        A = np.asarray(A, dtype=float)
+        A = A.reshape(A.shape[0], v.size)
+
+    # cosine distances are normalised dot products
+    if d == 'cosine':
+        if scipy.sparse.issparse(A):
+            norms = np.sqrt(np.asarray(A.multiply(A).sum(axis=1)).ravel())
+        else:
+            norms = np.linalg.norm(A, axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 1 - (A @ v) / (norms * np.linalg.norm(v))
+
+    # everything else goes through cdist, a block of rows at a time for sparse matrices
+    if not scipy.sparse.issparse(A):
+        return cdist(v[np.newaxis, :], A, d)[0]
+
+    return np.concatenate([
+        cdist(v[np.newaxis, :], A[start:start + 1024].toarray(), d)[0] for start in range(0, A.shape[0], 1024)
+    ] or [np.zeros(0)])
 
-def pairwise_euclidean_distance(M, axis=0):
+def _top_k(distances, k):
+    """
+        Selects the k smallest distances.
+        Returns a pair of indexes and distances, sorted by distance.
+
+        distances: Vector of distances.
+        k: Number of distances to select. If None, select all of them.
+    """
+
+    if k == None or k >= len(distances):
+        indexes = np.argsort(distances, kind='stable')
+    elif k < 1:
+        indexes = np.zeros(0, dtype=np.int64)
+    else:
+        # find the k-th smallest distance by partially sorting
+        kth = distances[np.argpartition(distances, k - 1)[k - 1]]
+
+        # take everything closer, and break ties by index (nans come last)
+        if np.isnan(kth):
+            closer = ~np.isnan(distances)
+            equal = np.isnan(distances)
+        else:
+            closer = distances < kth
+            equal = distances == kth
+
+        closer = np.flatnonzero(closer)
+        indexes = np.concatenate((closer, np.flatnonzero(equal)[:k - len(closer)]))
+        indexes = indexes[np.lexsort((indexes, distances[indexes]))]
+
+    return (indexes, distances[indexes])
+
+def pairwise_euclidean_distance(M, axis=0, condensed=False, fast=False, dtype=None):
     """
         Returns a square matrix of pairwise euclidean distances of elements
         within a matrix.
 
         M: Matrix to compute distances in.
         axis: Axis to compute distance against. Defaults to 0.
+        condensed: If set to True, return a CondensedDistanceMatrix instead of a square matrix. Defaults to False.
+        fast: If set to True, use a single matrix product (see euclidean_distance_matrix) instead of pdist. Slightly less precise. Defaults to False.
+        dtype: Optional. Floating point type to compute in when fast is set, e.g. numpy.float32.
     """
 
-    return pairwise_distance(M, 'euclidean', axis=axis)
+    if fast:
+        return _fast_pairwise(euclidean_distance_matrix, M, axis, condensed, dtype)
+
+    return pairwise_distance(M, 'euclidean', axis=axis, condensed=condensed)
 
-def pairwise_cosine_distance(M, axis=0):
+def pairwise_cosine_distance(M, axis=0, condensed=False, fast=False, dtype=None):
     """
         Returns a square matrix of pairwise cosine distances of elements
         within a matrix.
 
         M: Matrix to compute distances in.
         axis: Axis to compute distance against. Defaults to 0.
+        condensed: If set to True, return a CondensedDistanceMatrix instead of a square matrix. Defaults to False.
+        fast: If set to True, use a single matrix product (see cosine_distance_matrix) instead of pdist. Slightly less precise. Defaults to False.
+        dtype: Optional. Floating point type to compute in when fast is set, e.g. numpy.float32.
+    """
+
+    if fast:
+        return _fast_pairwise(cosine_distance_matrix, M, axis, condensed, dtype)
+
+    return pairwise_distance(M, 'cosine', axis=axis, condensed=condensed)
+
+def _fast_pairwise(kernel, M, axis, condensed, dtype):
+    """
+        Computes a pairwise distance matrix with a matrix product kernel.
+
+        kernel: Kernel to use, either euclidean_distance_matrix or cosine_distance_matrix.
+        M: Matrix to compute distances in.
+        axis: Axis to compute distance against.
+        condensed: If set to True, return a CondensedDistanceMatrix.
+        dtype: Floating point type to compute in. Optional.
+    """
+
+    D = kernel(M if axis==0 else M.T, dtype=dtype)
+
+    if condensed:
+        return CondensedDistanceMatrix(squareform(D, checks=False))
+
+    return D
+
+def euclidean_distance_matrix(X, Y=None, dtype=None):
+    """
+        Computes the euclidean distances between all rows of X and all rows of Y using one matrix product,
+        via |a - b|^2 = |a|^2 + |b|^2 - 2 a.b. Rounding errors are clamped, so distances are never negative.
+
+        X: Matrix of vectors, one per row.
+        Y: Optional. Second matrix of vectors. Defaults to X, in which case the diagonal is exactly 0.
+        dtype: Optional. Floating point type to compute in, e.g. numpy.float32. Defaults to numpy.float64.
+    """
+
+    (X, Y, same) = _kernel_inputs(X, Y, dtype)
+
+    # squared norms of all vectors
+    XX = np.einsum('ij,ij->i', X, X)
+    YY = XX if same else np.einsum('ij,ij->i', Y, Y)
+
+    # |a|^2 + |b|^2 - 2 a.b, computed in place
+    D = X @ Y.T
+    D *= -2
+    D += XX[:, np.newaxis]
+    D += YY[np.newaxis, :]
+
+    np.maximum(D, 0, out=D)
+    np.sqrt(D, out=D)
+
+    if same:
+        np.fill_diagonal(D, 0)
+
+    return D
+
+def cosine_distance_matrix(X, Y=None, dtype=None):
+    """
+        Computes the cosine distances between all rows of X and all rows of Y using one matrix product of normalised vectors.
+        Similarities are clamped to [-1, 1]. Like scipy, distances involving zero vectors are nan.
+
+        X: Matrix of vectors, one per row.
+        Y: Optional. Second matrix of vectors. Defaults to X, in which case the diagonal is exactly 0.
+        dtype: Optional. Floating point type to compute in, e.g. numpy.float32. Defaults to numpy.float64.
+    """
+
+    (X, Y, same) = _kernel_inputs(X, Y, dtype)
+
+    # norms of all vectors
+    XN = np.sqrt(np.einsum('ij,ij->i', X, X))
+    YN = XN if same else np.sqrt(np.einsum('ij,ij->i', Y, Y))
+
+    # 1 - a.b / (|a| |b|), computed in place
+    D = X @ Y.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        D /= XN[:, np.newaxis]
+        D /= YN[np.newaxis, :]
+
+    np.clip(D, -1, 1, out=D)
+    np.subtract(1, D, out=D)
+
+    if same:
+        np.fill_diagonal(D, 0)
+
+    return D
+
+def _kernel_inputs(X, Y, dtype):
     """
+        Prepares the inputs of a distance kernel.
+        Returns X and Y as dense floating point matrices, and if they are the same.
+
+        X: Matrix of vectors, one per row.
+        Y: Second matrix of vectors, or None to use X.
+        dtype: Floating point type to use, or None for numpy.float64.
+    """
+
+    if dtype == None:
+        dtype = np.float64
+
+    X = np.asarray(X, dtype=dtype)
+    X = X.reshape(X.shape[0], -1)
 
-    return pairwise_distance(M, 'cosine', axis=axis)
+    if Y is None:
+        return (X, X, True)
 
-def pairwise_distance(M, d, axis=0):
+    Y = np.asarray(Y, dtype=dtype)
+    return (X, Y.reshape(Y.shape[0], -1), False)
+
+def pairwise_distance(M, d, axis=0, condensed=False, n_jobs=1):
     """
         Returns a square matrix of pairwise distances of elements
         within a matrix.
@@ -50,6 +246,468 @@ def pairwise_distance(M, d, axis=0):
         M: Matrix to compute distances in.
         d: Distance metric to apply.
         axis: Axis to compute distance against. Defaults to 0.
+        condensed: If set to True, return a CondensedDistanceMatrix instead of a square matrix. Defaults to False.
+        n_jobs: Number of threads to compute distances in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+    """
+
+    n_jobs = _n_jobs(n_jobs)
+
+    # look for the distances in the cache
+    key = None
+    if _distance_cache != None and isinstance(d, str):
+        key = _distance_cache.key(M, d, axis)
+        D = _distance_cache.get(key)
+    else:
+        D = None
+
+    if D is None:
+        if n_jobs == 1:
+            D = pdist(M if axis==0 else M.T, d)
+        else:
+            D = _parallel_pdist(M if axis==0 else M.T, d, n_jobs)
+
+        if key != None:
+            _distance_cache.put(key, D)
+
+    if condensed:
+        return CondensedDistanceMatrix(D)
+
+    return squareform(D)
+
+class DistanceCache(object):
+    """
+        Memoizes condensed distance vectors by a hash of the content of the input matrix, the metric and the axis.
+        Keeps a size-bounded LRU tier in memory, and optionally a second tier of .npy files in a directory.
+    """
+
+    def __init__(self, maxbytes=2**30, directory=None):
+        """
+            Creates a new cache.
+
+            maxbytes: Maximal number of bytes of distances to keep in memory. Defaults to 1 GiB.
+            directory: Optional. Directory to also store distances in, so that they survive restarts.
+        """
+
+        self.memory = LRUCache(maxsize=maxbytes, thread_safe=True, weigh=lambda D: D.nbytes)
+        self.directory = directory
+
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        if directory != None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, M, d, axis):
+        """
+            Returns the cache key of the distances of a matrix.
+
+            M: Matrix to compute distances in.
+            d: Name of distance metric.
+            axis: Axis to compute distance against.
+        """
+
+        M = np.ascontiguousarray(M)
+
+        h = hashlib.blake2b(digest_size=20)
+        h.update(repr((M.shape, M.dtype.str, d, axis)).encode('utf-8'))
+        h.update(M.data if M.size > 0 else b'')
+
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+            Returns the cached condensed distances for a key, or None.
+
+            key: Key as returned by key.
+        """
+
+        D = self.memory.get(key)
+        if D is not None or self.directory == None:
+            return D
+
+        # fall back to the disk
+        filename = os.path.join(self.directory, key + '.npy')
+        if not os.path.exists(filename):
+            self.disk_misses += 1
+            return None
+
+        self.disk_hits += 1
+        D = np.load(filename, mmap_mode='r')
+        self.memory[key] = D
+
+        return D
+
+    def put(self, key, D):
+        """
+            Stores condensed distances for a key.
+
+            key: Key as returned by key.
+            D: Condensed distance vector. Made read-only, as it is shared by all later callers.
+        """
+
+        D.flags.writeable = False
+        self.memory[key] = D
+
+        if self.directory != None:
+            # write to a temporary file of this process and thread first, so that readers (and other writers) never see partial files
+            filename = os.path.join(self.directory, key + '.npy')
+            temporary = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+
+            try:
+                with open(temporary, 'wb') as f:
+                    np.save(f, D)
+                os.replace(temporary, filename)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+
+    def clear(self):
+        """
+            Removes all distances from memory. Files on disk are kept.
+        """
+
+        self.memory.clear()
+
+    def stats(self):
+        """
+            Returns a dict of statistics of both tiers.
+        """
+
+        return {
+            "memory": self.memory.stats(),
+            "disk": {"hits": self.disk_hits, "misses": self.disk_misses, "directory": self.directory}
+        }
+
+# cache used by pairwise_distance, if any
+_distance_cache = None
+
+def enable_distance_cache(maxbytes=2**30, directory=None):
+    """
+        Turns on memoization of pairwise distances computed with a named metric.
+        Returns the new DistanceCache.
+
+        maxbytes: Maximal number of bytes of distances to keep in memory. Defaults to 1 GiB.
+        directory: Optional. Directory to also store distances in, so that they survive restarts.
+    """
+
+    global _distance_cache
+    _distance_cache = DistanceCache(maxbytes=maxbytes, directory=directory)
+
+    return _distance_cache
+
+def disable_distance_cache():
     """
+        Turns off memoization of pairwise distances.
+    """
+
+    global _distance_cache
+    _distance_cache = None
+
+def distance_cache_stats():
+    """
+        Returns the statistics of the distance cache, or None if it is disabled.
+    """
+
+    return None if _distance_cache == None else _distance_cache.stats()
+
+def _parallel_pdist(X, d, n_jobs):
+    """
+        Computes the same condensed distance vector as scipy.spatial.distance.pdist, splitting rows into blocks computed by a pool of threads.
+        All threads share X and write into one output vector.
+
+        X: Matrix to compute distances between rows of.
+        d: Distance metric to apply.
+        n_jobs: Number of threads to use. Negative values count back from the number of cores.
+    """
+
+    n_jobs = _n_jobs(n_jobs)
+
+    X = np.ascontiguousarray(X, dtype=float) if isinstance(d, str) else np.asarray(X)
+    n = X.shape[0]
+
+    # metrics that are parametrised by the data need to see all of it
+    kwargs = {}
+    if d == 'seuclidean':
+        kwargs['V'] = np.var(X, axis=0, ddof=1)
+    elif d == 'mahalanobis':
+        kwargs['VI'] = np.linalg.inv(np.cov(X.T)).T
+
+    D = np.zeros(n * (n - 1) // 2)
+
+    # split rows into blocks with about the same number of pairs each
+    pairs = np.cumsum(np.arange(n - 1, -1, -1))
+    n_blocks = min(4 * n_jobs, max(n - 1, 1))
+    bounds = np.unique(np.searchsorted(pairs, np.linspace(0, pairs[-1] if n > 0 else 0, n_blocks + 1)[1:-1]))
+    bounds = [0] + [int(b) + 1 for b in bounds if b + 1 < n] + [n]
+
+    def block(start, stop):
+        T = cdist(X[start:stop], X[start:], d, **kwargs)
+
+        # copy the part right of the diagonal of each row
+        offset = n * start - start * (start + 1) // 2
+        for r in range(stop - start):
+            length = n - start - r - 1
+            D[offset:offset + length] = T[r, r + 1:]
+            offset += length
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for f in [pool.submit(block, a, b) for (a, b) in zip(bounds[:-1], bounds[1:]) if a < b]:
+            f.result()
+
+    return D
+
+class CondensedDistanceMatrix(object):
+    """
+        A symmetric distance matrix with a zero diagonal that only stores the distances above the diagonal,
+        in the condensed form returned by scipy.spatial.distance.pdist. Uses half the memory of a square matrix.
+    """
+
+    def __init__(self, condensed):
+        """
+            Wraps a condensed distance vector.
+
+            condensed: Condensed distance vector, as returned by scipy.spatial.distance.pdist.
+        """
+
+        self.condensed = np.asarray(condensed)
+
+        # find n with n * (n - 1) / 2 distances
+        n = int(np.round((1 + np.sqrt(1 + 8 * len(self.condensed))) / 2))
+        if n * (n - 1) // 2 != len(self.condensed):
+            raise ValueError("Condensed distance vector has an invalid length")
+
+        self.n = n
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+
+    @property
+    def dtype(self):
+        return self.condensed.dtype
+
+    def __len__(self):
+        return self.n
+
+    def index(self, i, j):
+        """
+            Returns the position of the distance between elements i < j within the condensed vector.
+            Works on arrays of indexes as well.
+
+            i: Index of first element.
+            j: Index of second element, greater than i.
+        """
+
+        return self.n * i - i * (i + 1) // 2 + (j - i - 1)
+
+    def _check_index(self, i):
+        """
+            Returns an index of an element, counting negative indexes from the end.
+            Raises an IndexError if it is out of range.
+
+            i: Index to check.
+        """
+
+        i = int(i)
+        if i < 0:
+            i += self.n
+
+        if i < 0 or i >= self.n:
+            raise IndexError("Index out of range for %d elements" % self.n)
+
+        return i
+
+    def __getitem__(self, ij):
+        """
+            Returns the distance between two elements.
+
+            ij: Pair of indexes (i, j).
+        """
+
+        (i, j) = (self._check_index(ij[0]), self._check_index(ij[1]))
+        if i == j:
+            return self.condensed.dtype.type(0)
+
+        (i, j) = (min(i, j), max(i, j))
+        return self.condensed[self.index(i, j)]
+
+    def row(self, i):
+        """
+            Returns the distances of one element to all elements.
+
+            i: Index of element.
+        """
+
+        i = self._check_index(i)
+        row = np.zeros(self.n, dtype=self.condensed.dtype)
+
+        # elements before i are spread out, elements after i are stored together
+        before = np.arange(i)
+        row[:i] = self.condensed[self.index(before, i)]
+        row[i + 1:] = self.condensed[self.index(i, i + 1):self.index(i, i + 1) + self.n - i - 1]
+
+        return row
+
+    def rows(self, indexes):
+        """
+            Returns the distances of several elements to all elements, one row per element.
+
+            indexes: Indexes of elements.
+        """
+
+        return np.array([self.row(i) for i in indexes], dtype=self.condensed.dtype).reshape(-1, self.n)
+
+    def toarray(self):
+        """
+            Returns the full square distance matrix.
+        """
+
+        return squareform(self.condensed)
+
+    def __array__(self, dtype=None, copy=None):
+        A = self.toarray()
+        return A if dtype == None else A.astype(dtype)
+
+    def radius_graph(self, eps):
+        """
+            Returns a sparse csr matrix holding only the distances of at most eps, with explicit zeros for duplicate elements.
+            The diagonal is not stored.
+
+            eps: Maximal distance to keep.
+        """
+
+        rows = []
+        columns = []
+        data = []
+
+        # find the close elements after each element
+        for i in range(self.n - 1):
+            start = self.index(i, i + 1)
+            segment = self.condensed[start:start + self.n - i - 1]
+            close = np.flatnonzero(segment <= eps)
+
+            rows.append(np.full(len(close), i))
+            columns.append(close + i + 1)
+            data.append(segment[close])
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        data = np.concatenate(data) if data else np.zeros(0, dtype=self.condensed.dtype)
+
+        # and mirror them below the diagonal
+        return scipy.sparse.coo_matrix(
+            (np.concatenate((data, data)), (np.concatenate((rows, columns)), np.concatenate((columns, rows)))),
+            shape=self.shape
+        ).tocsr()
+
+def pairwise_distance_blocks(M, d, axis=0, block_size=1024, dtype=None, n_jobs=1, fast=False):
+    """
+        Computes pairwise distances of elements within a matrix a block of rows at a time, without ever holding the full matrix.
+        Yields tuples (start, stop, tile), where tile holds the distances of elements start to stop to all elements.
+
+        M: Matrix to compute distances in.
+        d: Distance metric to apply.
+        axis: Axis to compute distance against. Defaults to 0.
+        block_size: Number of rows per tile. Defaults to 1024.
+        dtype: Optional. Type of the tiles, e.g. numpy.float32 to halve memory usage.
+        n_jobs: Number of threads to compute tiles in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+        fast: If set to True, compute 'euclidean' and 'cosine' tiles with a matrix product kernel. Defaults to False.
+    """
+
+    n_jobs = _n_jobs(n_jobs)
+
+    X = np.asarray(M if axis==0 else M.T)
+    n = X.shape[0]
+
+    kernel = _KERNELS.get(d) if fast else None
+
+    def tile(start):
+        stop = min(start + block_size, n)
+        if kernel != None:
+            T = kernel(X[start:stop], X, dtype=dtype)
+        else:
+            T = cdist(X[start:stop], X, d)
+
+        # every element has distance 0 to itself
+        T[np.arange(stop - start), np.arange(start, stop)] = 0
+
+        if dtype != None:
+            T = T.astype(dtype, copy=False)
+
+        return (start, stop, T)
+
+    starts = range(0, n, block_size)
+
+    if n_jobs == 1:
+        for start in starts:
+            yield tile(start)
+        return
+
+    # compute a few tiles per thread at a time, so that memory stays bounded
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for i in range(0, len(starts), 2 * n_jobs):
+            yield from pool.map(tile, starts[i:i + 2 * n_jobs])
+
+# matrix product kernels for metrics that have one
+_KERNELS = {
+    'euclidean': euclidean_distance_matrix,
+    'cosine': cosine_distance_matrix
+}
+
+def pairwise_distance_memmap(M, d, filename, axis=0, block_size=1024, dtype=np.float64, n_jobs=1):
+    """
+        Writes the square matrix of pairwise distances of elements within a matrix to a memory-mapped .npy file, one block of rows at a time.
+        Returns the memory-mapped matrix.
+
+        M: Matrix to compute distances in.
+        d: Distance metric to apply.
+        filename: Path of .npy file to write.
+        axis: Axis to compute distance against. Defaults to 0.
+        block_size: Number of rows to compute at once. Defaults to 1024.
+        dtype: Type of the distances. Defaults to numpy.float64.
+        n_jobs: Number of threads to compute blocks in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+    """
+
+    n = M.shape[0 if axis==0 else 1]
+    D = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(n, n))
+
+    for (start, stop, T) in pairwise_distance_blocks(M, d, axis=axis, block_size=block_size, dtype=dtype, n_jobs=n_jobs):
+        D[start:stop] = T
+
+    D.flush()
+    return D
+
+def pairwise_nearest(M, d, k, axis=0, block_size=1024, dtype=None, n_jobs=1, include_self=False):
+    """
+        Finds the k nearest neighbours of each element within a matrix, one block of rows at a time.
+        Returns a pair of matrices of neighbour indexes and distances, one row per element, closest first.
+
+        M: Matrix to compute distances in.
+        d: Distance metric to apply.
+        k: Number of neighbours to find.
+        axis: Axis to compute distance against. Defaults to 0.
+        block_size: Number of rows to compute at once. Defaults to 1024.
+        dtype: Optional. Type of the distances.
+        n_jobs: Number of threads to compute blocks in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+        include_self: If set to True, each element counts as its own neighbour. Defaults to False.
+    """
+
+    n = M.shape[0 if axis==0 else 1]
+    k = min(k, n if include_self else n - 1)
+
+    indexes = np.zeros((n, k), dtype=np.int64)
+    distances = np.zeros((n, k), dtype=np.float64 if dtype == None else dtype)
+
+    for (start, stop, T) in pairwise_distance_blocks(M, d, axis=axis, block_size=block_size, dtype=dtype, n_jobs=n_jobs):
+        if not include_self:
+            T[np.arange(stop - start), np.arange(start, stop)] = np.inf
+
+        # keep the k closest elements of each row
+        nearest = np.argpartition(T, k - 1, axis=1)[:, :k] if k > 0 else np.zeros((stop - start, 0), dtype=np.int64)
+        nearest_distances = np.take_along_axis(T, nearest, axis=1)
+
+        order = np.lexsort((nearest, nearest_distances), axis=1)
+        indexes[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:stop] = np.take_along_axis(nearest_distances, order, axis=1)
 
-    return squareform(pdist(M if axis==0 else M.T, d))
+    return (indexes, distances)
@@ -0,0 +1,19 @@
+import os
+
+def _n_jobs(n_jobs):
+    """
+        Resolves a number of parallel jobs to a number of workers.
+
+        n_jobs: Number of jobs. Negative values count back from the number of cores, so -1 uses all of them. None means 1.
+    """
+
+    if n_jobs == None:
+        return 1
+
+    if n_jobs == 0:
+        raise ValueError("n_jobs must not be 0, use 1 to run sequentially or -1 to use all cores")
+
+    if n_jobs < 0:
+        return max(1, os.cpu_count() + 1 + n_jobs)
+
+    return n_jobs
@@ -0,0 +1,182 @@
+import numpy as np
+import scipy.sparse
+
+from DataAnalytics.distances import _top_k
+
+class LSHIndex(object):
+    """
+        Approximate nearest neighbour index for cosine distance, using random projection locality sensitive hashing.
+
+        Each of n_tables tables hashes every vector to the signs of n_bits random projections.
+        A query only looks at vectors sharing a bucket with it in some table, and ranks those by their exact cosine distance.
+        More bits make buckets smaller (faster, lower recall), more tables and probes find more candidates (slower, higher recall).
+    """
+
+    def __init__(self, A, n_bits=16, n_tables=8, seed=None):
+        """
+            Builds a new index.
+
+            A: Matrix of vectors to index, one per row. May be sparse.
+            n_bits: Number of bits (random projections) per table, at most 64. Defaults to 16.
+            n_tables: Number of hash tables. Defaults to 8.
+            seed: Random number generator seed to use. Optional.
+        """
+
+        if n_bits > 64:
+            raise ValueError("n_bits can be at most 64")
+
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+
+        # keep normalised vectors, so that cosine similarity is a dot product
+        self.data = _normalize_rows(A)
+
+        # random hyperplanes, one set per table
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables * n_bits, self.data.shape[1])).astype(np.float32)
+
+        # hash all vectors a block at a time and sort them by hash in each table
+        keys = np.hstack([
+            self._keys(self.data[start:start + 65536] @ self.planes.T) for start in range(0, self.data.shape[0], 65536)
+        ] or [np.zeros((n_tables, 0), dtype=np.uint64)])
+        self.order = np.argsort(keys, axis=1, kind='stable')
+        self.keys = np.take_along_axis(keys, self.order, axis=1)
+
+    def __len__(self):
+        """
+            Returns the number of vectors in this index.
+        """
+
+        return self.data.shape[0]
+
+    def _keys(self, projections):
+        """
+            Turns projections onto the hyperplanes into one hash key per table.
+
+            projections: Matrix of projections, one row per vector.
+        """
+
+        bits = (np.asarray(projections) > 0).reshape(-1, self.n_tables, self.n_bits)
+        powers = np.left_shift(np.uint64(1), np.arange(self.n_bits, dtype=np.uint64))
+
+        return np.bitwise_or.reduce(np.where(bits, powers, np.uint64(0)), axis=2).T
+
+    def candidates(self, v, n_probe=0):
+        """
+            Returns the indexes of all vectors sharing a bucket with a vector in some table.
+
+            v: Vector to find candidates for.
+            n_probe: Number of additional buckets to look at per table. Each one flips one of the bits the vector is closest to flipping. Defaults to 0.
+        """
+
+        projections = (self.planes @ v).reshape(self.n_tables, self.n_bits)
+        keys = self._keys(projections.reshape(1, -1))[:, 0]
+
+        found = []
+
+        for t in range(self.n_tables):
+            probes = [keys[t]]
+
+            # flip the least certain bits for multi-probing
+            for b in np.argsort(np.abs(projections[t]))[:n_probe]:
+                probes.append(keys[t] ^ np.uint64(1 << int(b)))
+
+            for key in probes:
+                lo = np.searchsorted(self.keys[t], key, side='left')
+                hi = np.searchsorted(self.keys[t], key, side='right')
+                found.append(self.order[t, lo:hi])
+
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def query(self, v, k=10, n_probe=0):
+        """
+            Queries for the approximately closest vectors by cosine distance.
+            Returns a pair of indexes and cosine distances, closest first. May return less than k vectors.
+
+            v: Vector to search for.
+            k: Number of vectors to return. Defaults to 10.
+            n_probe: Number of additional buckets to look at per table. Defaults to 0.
+        """
+
+        if scipy.sparse.issparse(v):
+            v = v.toarray()
+        v = np.asarray(v, dtype=float).ravel()
+
+        norm = np.linalg.norm(v)
+        if norm > 0:
+            v = v / norm
+
+        # rank the candidates exactly
+        candidates = self.candidates(v, n_probe=n_probe)
+        distances = 1 - np.asarray(self.data[candidates] @ v).ravel()
+
+        (indexes, distances) = _top_k(distances, k)
+        return (candidates[indexes], distances)
+
+    def save(self, filename):
+        """
+            Saves this index to a .npz file.
+
+            filename: Path of file to write.
+        """
+
+        arrays = {
+            "n_bits": self.n_bits,
+            "n_tables": self.n_tables,
+            "planes": self.planes,
+            "keys": self.keys,
+            "order": self.order
+        }
+
+        if scipy.sparse.issparse(self.data):
+            arrays.update(data=self.data.data, indices=self.data.indices, indptr=self.data.indptr, shape=self.data.shape)
+        else:
+            arrays.update(data=self.data)
+
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """
+            Loads an index saved by save.
+
+            filename: Path of file to read.
+        """
+
+        with np.load(filename) as f:
+            index = cls.__new__(cls)
+
+            index.n_bits = int(f["n_bits"])
+            index.n_tables = int(f["n_tables"])
+            index.planes = f["planes"]
+            index.keys = f["keys"]
+            index.order = f["order"]
+
+            if "indptr" in f:
+                index.data = scipy.sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            else:
+                index.data = f["data"]
+
+        return index
+
+def _normalize_rows(A):
+    """
+        Scales all rows of a matrix to unit length, leaving zero rows alone.
+
+        A: Matrix to normalise. May be sparse.
+    """
+
+    if scipy.sparse.issparse(A):
+        A = scipy.sparse.csr_matrix(A, dtype=float, copy=True)
+        norms = np.sqrt(np.asarray(A.multiply(A).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        A.data /= np.repeat(norms, np.diff(A.indptr))
+        return A
+
+    A = np.array(A, dtype=float)
+    if A.ndim != 2:
+        A = A.reshape(A.shape[0], -1)
+    norms = np.linalg.norm(A, axis=1)
+    norms[norms == 0] = 1
+
+    return A / norms[:, np.newaxis]
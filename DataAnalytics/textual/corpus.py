@@ -1,60 +1,128 @@
 import numpy as np
+import scipy.sparse
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 from DataAnalytics.distances import order_by_distance
-from DataAnalytics.textual.words import find_words, count_words, count_all_words, stem_word
+from DataAnalytics.jobs import _n_jobs
+from DataAnalytics.textual.words import find_words, count_words, count_stemmed_words, stem_word
+from DataAnalytics.textual.hashing import WordHasher
 
 
-def query_to_index(query, IDF, words, M, d=None):
+def query_to_index(query, IDF, words, M, d=None, k=None):
     """
         Queries for similar document in a word count matrix.
 
         query: New document to search for.
         IDF: IDF vector
-        words: Words the word count matrix consists of.
-        M: Term Importance matrix.
+        words: Words the word count matrix consists of, or the WordHasher it was made with.
+        M: Term Importance matrix. May be dense or sparse.
         d: Distance Function ( = metric) to use.
+        k: Optional. If given, only return the k most similar documents.
     """
 
     # count words inside this vector
-    vquery = IDF*count_words(query, words=words)
-
-    # split all our documents
-    docs = np.split(M, M.shape[0], axis=0)
+    if isinstance(words, WordHasher):
+        vquery = IDF*words.count_words(query)
+    else:
+        vquery = IDF*count_words(query, words=words)
 
     # and return the best documents by index
-    return order_by_distance(vquery, docs, d)
+    return order_by_distance(vquery, M, d, k=k)
 
 
-def make_TIM(M):
+def make_TIM(M, dtype = None, inplace = False):
     """
         Makes a term importance matrix from a word count matrix.
 
-        M: Word count matrix to transform.
+        M: Word count matrix to transform. May be dense or sparse.
+        dtype: Optional. Floating point type of the IDF vector and term importance matrix, e.g. numpy.float32 to halve memory usage.
+        inplace: If set to True, overwrite M with the term importance matrix. M needs to be a floating point numpy array or scipy.sparse.csr_matrix of type dtype (if given). Defaults to False.
+    """
+
+    if inplace:
+        _check_inplace(M, dtype)
+
+    # compute the IDFs
+    IDF = make_IDF(M, dtype=dtype)
+    if dtype == None:
+        dtype = np.result_type(M.dtype, IDF.dtype)
+
+    if scipy.sparse.issparse(M):
+        # sparse matrices only need to scale their stored entries
+        if inplace:
+            TIM = M
+        else:
+            TIM = scipy.sparse.csr_matrix(M, dtype=dtype, copy=True)
+        TIM.data *= IDF[TIM.indices]
+    else:
+        # dense matrices scale each column
+        if inplace:
+            TIM = M
+        else:
+            TIM = np.array(M, dtype=dtype)
+        TIM *= IDF
+
+    # return a term importatnce matrix
+    return (IDF, TIM)
+
+def make_IDF(M, dtype = None):
+    """
+        Computes the inverse document frequency (IDF) of each word in a word count matrix.
+
+        M: Word count matrix to use. May be dense or sparse.
+        dtype: Optional. Floating point type of the IDF vector. Defaults to numpy.float64.
     """
 
     N = M.shape[0]
 
-    # generate a matrix of zeros and ones
-    ZO = np.zeros(M.shape)
-    for x in range(M.shape[0]):
-        for y in range(M.shape[1]):
-            ZO[x][y] = 1 if M[x][y] > 0 else 0
+    # count the documents each word occurs in
+    if scipy.sparse.issparse(M):
+        M = scipy.sparse.csr_matrix(M)
+        wj = np.bincount(M.indices[M.data != 0], minlength=M.shape[1])
+    else:
+        wj = np.count_nonzero(M, axis=0)
+
+    # every word occurs at least once
+    wj = np.maximum(wj, 1)
 
-    # compute the IDFs
-    wj = np.sum(ZO, axis=0)
-    wj = np.array([max(1, j) for j in wj])
     IDF = np.log(N / wj)
+    if dtype != None:
+        IDF = IDF.astype(dtype)
 
-    # return a term importatnce matrix
-    return (IDF, IDF*M)
+    return IDF
+
+def _check_inplace(M, dtype):
+    """
+        Ensures that a matrix can be overwritten by a term importance matrix.
 
-def word_count_matrix(documents, n = 0, words = None, stop_words = None):
+        M: Matrix to check.
+        dtype: Requested floating point type of the term importance matrix, or None.
+    """
+
+    if scipy.sparse.issparse(M) and not scipy.sparse.isspmatrix_csr(M):
+        raise ValueError("Can only compute a sparse term importance matrix in place on a csr matrix")
+
+    if not np.issubdtype(M.dtype, np.floating):
+        raise ValueError("Can only compute a term importance matrix in place on a floating point matrix")
+
+    if dtype != None and np.dtype(dtype) != M.dtype:
+        raise ValueError("Can not change the type of a matrix when computing a term importance matrix in place")
+
+def word_count_matrix(documents, n = 0, words = None, stop_words = None, sparse = False, n_jobs = 1, executor = None, chunk_size = None):
     """
         Turns an array of documents into a word count matrix.
 
-        documents: Array of strings to check.
+        documents: Array (or any other iterable) of strings to check.
         n: Will only take the n words that occur most frequently. If n=0, take all words.
         words: Optional. Words to count.
         stop_words: Optional. Words to ignore.
+        sparse: If set to True, return a scipy.sparse.csr_matrix instead of a dense array. Defaults to False.
+        n_jobs: Number of processes to count words in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+        executor: Optional. concurrent.futures.Executor to count words in. n_jobs should be set to its number of workers.
+        chunk_size: Optional. If given, documents are read lazily and counted in chunks of this many documents, so that only a few chunks are held in memory at a time.
     """
 
     # if we have no words yet set them as basic words
@@ -64,41 +132,29 @@ def word_count_matrix(documents, n = 0, words = None, stop_words = None):
         words = list(map(stem_word, words))
 
     if stop_words == None:
-        stop_words = []
+        stop_words = set()
     else:
-        stop_words = list(map(stem_word, stop_words))
+        stop_words = set(map(stem_word, stop_words))
 
-    # introduce an array of words
-    counts = [[] for d in documents]
+    # count all the words into a sparse matrix
+    builder = _WordCountMatrixBuilder(words)
+    for shard in _count_shards(documents, n_jobs, executor, chunk_size):
+        builder.add(shard)
 
-    for i, d in enumerate(documents):
-        # count the number of words we had before
-        wl = len(words)
+    (words, words_matrix) = (builder.words, builder.matrix())
 
-        # count all the words and update the counts
-        (words, counts[i]) = count_all_words(d, and_words = words)
-
-        # generate an array of zeros to add to the previous numbers
-        wl = [0]*(len(words) - wl)
-
-        # and add them to the matrix
-        for j in range(i):
-            counts[j] += wl
-
-    # turn it into a matrix now
-    words_matrix = np.array(counts)
-
-    # indexes to remove
-    indexes_remove = list(map(lambda p:p[0], filter(lambda p:p[1] in stop_words,enumerate(words))))
+    # indexes to keep
+    indexes_keep = [i for (i, w) in enumerate(words) if not w in stop_words]
 
     # remove stop words
-    words_matrix = np.delete(words_matrix, indexes_remove, axis=0)
-    words = np.delete(words, indexes_remove).tolist()
+    if len(indexes_keep) < len(words):
+        words_matrix = words_matrix[:, indexes_keep]
+        words = [words[i] for i in indexes_keep]
 
     # if given specifically take only the first n indexes
     if n > 0:
         # count all the word frequencies
-        word_frequences = np.sum(words_matrix, axis=0)
+        word_frequences = np.asarray(words_matrix.sum(axis=0)).ravel()
 
         # find the top word indexes
         top_words_indexes = np.argsort(word_frequences)[::-1][:n]
@@ -109,6 +165,239 @@ def word_count_matrix(documents, n = 0, words = None, stop_words = None):
         # update the words matrix
         words_matrix = words_matrix[:, top_words_indexes]
 
+    # turn it into a dense matrix if needed
+    if not sparse:
+        words_matrix = words_matrix.toarray()
 
     # return found words and word matrix
     return words, words_matrix
+
+def hashing_word_count_matrix(documents, n_features = 2**18, signed = False, stop_words = None, n_jobs = 1, executor = None, chunk_size = None):
+    """
+        Turns an array of documents into a sparse word count matrix with a fixed number of columns, using the hashing trick.
+        Returns the WordHasher used and the matrix. The WordHasher can be passed to query_to_index instead of a list of words.
+
+        documents: Array (or any other iterable) of strings to check.
+        n_features: Number of columns to hash words into. Defaults to 2**18.
+        signed: If set to True, use a signed hash to reduce the bias of collisions. Defaults to False.
+        stop_words: Optional. Words to ignore.
+        n_jobs: Number of processes to count words in. Negative values count back from the number of cores, so -1 uses all of them. Defaults to 1.
+        executor: Optional. concurrent.futures.Executor to count words in. n_jobs should be set to its number of workers.
+        chunk_size: Optional. If given, documents are read lazily and counted in chunks of this many documents.
+    """
+
+    hasher = WordHasher(n_features=n_features, signed=signed, stop_words=stop_words)
+
+    # documents are independent, so their rows just need to be stacked
+    builder = _WordCountMatrixBuilder([])
+    for shard in _count_shards(documents, n_jobs, executor, chunk_size, count=hasher.count_documents):
+        builder.add_rows(*shard)
+
+    return (hasher, builder.matrix(n_columns=n_features))
+
+def read_documents(filenames, encoding = 'utf-8'):
+    """
+        Lazily reads one document from each file.
+
+        filenames: Iterable of paths of files to read.
+        encoding: Encoding of the files. Defaults to 'utf-8'.
+    """
+
+    for filename in filenames:
+        with open(filename, encoding=encoding) as f:
+            yield f.read()
+
+def read_document_lines(filename, encoding = 'utf-8'):
+    """
+        Lazily reads the lines of a (large) text file, one document per line.
+
+        filename: Path of file to read.
+        encoding: Encoding of the file. Defaults to 'utf-8'.
+    """
+
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            yield line
+
+def _count_documents(documents):
+    """
+        Counts words in an array of documents in a single pass.
+        Returns a list of words and the csr structure (indptr, indices, data) of the counts.
+
+        documents: Array of strings to check.
+    """
+
+    # map each word to its column
+    words = []
+    word_ids = {}
+
+    # compact buffers for the csr structure
+    indptr = array('q', [0])
+    indices = array('q')
+    data = array('q')
+
+    for d in documents:
+        for (w, c) in count_stemmed_words(d).items():
+            # find the column of this word or make a new one
+            j = word_ids.get(w)
+            if j is None:
+                j = len(words)
+                word_ids[w] = j
+                words.append(w)
+
+            indices.append(j)
+            data.append(c)
+
+        indptr.append(len(indices))
+
+    return (words, np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(data, dtype=np.int64))
+
+def _count_shards(documents, n_jobs, executor, chunk_size, count=_count_documents):
+    """
+        Counts words in shards of documents, possibly in parallel.
+        Yields the counts of each shard in order.
+
+        documents: Iterable of strings to check.
+        n_jobs: Number of processes to use.
+        executor: concurrent.futures.Executor to use. Optional.
+        chunk_size: Number of documents per shard. Optional.
+        count: Function to count a shard with. Defaults to _count_documents.
+    """
+
+    # figure out the number of workers
+    n_jobs = _n_jobs(n_jobs)
+
+    parallel = executor != None or n_jobs > 1
+
+    # without a chunk size, count everything at once or make a few shards per worker
+    if chunk_size == None:
+        if not parallel:
+            yield count(documents)
+            return
+
+        documents = list(documents)
+        chunk_size = max(1, -(-len(documents) // (4 * n_jobs)))
+
+    shards = _iter_chunks(documents, chunk_size)
+
+    if not parallel:
+        for shard in shards:
+            yield count(shard)
+    elif executor != None:
+        yield from _map_bounded(executor, count, shards, 2 * n_jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            yield from _map_bounded(pool, count, shards, 2 * n_jobs)
+
+def _iter_chunks(iterable, chunk_size):
+    """
+        Lazily splits an iterable into lists of a given size.
+
+        iterable: Iterable to split.
+        chunk_size: Maximal size of each list.
+    """
+
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _map_bounded(executor, fn, iterable, max_pending):
+    """
+        Like executor.map, but only submits a bounded number of items ahead.
+
+        executor: concurrent.futures.Executor to run fn in.
+        fn: Function to apply.
+        iterable: Items to apply fn to.
+        max_pending: Maximal number of submitted but not yet returned items.
+    """
+
+    pending = deque()
+
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+class _WordCountMatrixBuilder(object):
+    """
+        Merges the word counts of consecutive shards of documents into a single sparse matrix.
+        Words keep the order of their first occurrence, no matter how documents were sharded.
+    """
+
+    def __init__(self, words):
+        """
+            Creates a new builder.
+
+            words: Words to count. New words are appended in order of first occurrence.
+        """
+
+        # map each word to its column
+        self.words = list(words)
+        self.word_ids = {}
+        for (i, w) in enumerate(self.words):
+            self.word_ids.setdefault(w, i)
+
+        # csr structure of all shards so far
+        self.indptr = [np.zeros(1, dtype=np.int64)]
+        self.indices = []
+        self.data = []
+        self.nnz = 0
+
+    def add(self, shard):
+        """
+            Adds the counts of a shard as returned by _count_documents.
+
+            shard: Tuple (words, indptr, indices, data) of the shard.
+        """
+
+        (words, indptr, indices, data) = shard
+
+        # translate the words of the shard into global columns
+        columns = np.empty(len(words), dtype=np.int64)
+        for (i, w) in enumerate(words):
+            j = self.word_ids.get(w)
+            if j is None:
+                j = len(self.words)
+                self.word_ids[w] = j
+                self.words.append(w)
+            columns[i] = j
+
+        # and append the rows
+        self.add_rows(indptr, columns[indices], data)
+
+    def add_rows(self, indptr, indices, data):
+        """
+            Appends rows given in csr structure with global columns.
+
+            indptr: Index pointers of the rows.
+            indices: Columns of the entries.
+            data: Values of the entries.
+        """
+
+        self.indptr.append(indptr[1:] + self.nnz)
+        self.indices.append(indices)
+        self.data.append(data)
+        self.nnz += len(indices)
+
+    def matrix(self, n_columns=None):
+        """
+            Returns the counts of all shards as a scipy.sparse.csr_matrix.
+
+            n_columns: Optional. Number of columns of the matrix. Defaults to the number of words.
+        """
+
+        if n_columns == None:
+            n_columns = len(self.words)
+
+        indptr = np.concatenate(self.indptr)
+        indices = np.concatenate(self.indices) if self.indices else np.zeros(0, dtype=np.int64)
+        data = np.concatenate(self.data) if self.data else np.zeros(0, dtype=np.int64)
+
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_columns))
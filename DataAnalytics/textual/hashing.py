@@ -0,0 +1,109 @@
+import zlib
+import numpy as np
+from array import array
+
+from DataAnalytics.textual.words import count_stemmed_words, stem_word
+
+class WordHasher(object):
+    """
+        Maps stemmed words into a fixed number of columns using the hashing trick.
+        Documents can then be vectorized independently and in constant memory, without a vocabulary.
+
+        A WordHasher can be used in place of the list of words of a word count matrix.
+    """
+
+    def __init__(self, n_features=2**18, signed=False, stop_words=None):
+        """
+            Creates a new hasher.
+
+            n_features: Number of columns to hash words into. Should be less than 2**31. Defaults to 2**18.
+            signed: If set to True, words are counted as +1 or -1 depending on their hash, so that collisions tend to cancel out instead of adding up. Defaults to False.
+            stop_words: Optional. Words to ignore.
+        """
+
+        self.n_features = n_features
+        self.signed = signed
+
+        if stop_words == None:
+            self.stop_words = frozenset()
+        else:
+            self.stop_words = frozenset(map(stem_word, stop_words))
+
+    def __len__(self):
+        """
+            Returns the number of columns words are hashed into.
+        """
+
+        return self.n_features
+
+    def hash_word(self, word):
+        """
+            Returns the column and sign (+1 or -1) of a stemmed word.
+
+            word: Stemmed word to hash.
+        """
+
+        # crc32 is stable across processes, unlike hash()
+        h = zlib.crc32(word.encode('utf-8'))
+
+        # the highest bit decides on the sign
+        sign = -1 if self.signed and h & 0x80000000 else 1
+
+        return (h % self.n_features, sign)
+
+    def count(self, text):
+        """
+            Counts words in a string.
+            Returns a pair of the columns (in ascending order) and their (possibly negative) counts.
+
+            text: Text to count words in.
+        """
+
+        counts = {}
+
+        for (w, c) in count_stemmed_words(text).items():
+            if w in self.stop_words:
+                continue
+
+            (j, sign) = self.hash_word(w)
+            counts[j] = counts.get(j, 0) + sign * c
+
+        # sort by column and drop collisions that cancelled out
+        columns = np.array(sorted(counts), dtype=np.int64)
+        values = np.array([counts[j] for j in columns.tolist()], dtype=np.int64)
+        nonzero = values != 0
+
+        return (columns[nonzero], values[nonzero])
+
+    def count_words(self, text):
+        """
+            Counts words in a string into a dense vector of length n_features.
+
+            text: Text to count words in.
+        """
+
+        vector = np.zeros(self.n_features, dtype=np.int64)
+        (columns, values) = self.count(text)
+        vector[columns] = values
+
+        return vector
+
+    def count_documents(self, documents):
+        """
+            Counts words in an array of documents.
+            Returns the csr structure (indptr, indices, data) of the counts.
+
+            documents: Array of strings to check.
+        """
+
+        indptr = array('q', [0])
+        indices = array('q')
+        data = array('q')
+
+        for d in documents:
+            (columns, values) = self.count(d)
+            indices.extend(columns.tolist())
+            data.extend(values.tolist())
+            indptr.append(len(indices))
+
+        return (np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(data, dtype=np.int64))
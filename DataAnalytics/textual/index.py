@@ -0,0 +1,284 @@
+import numpy as np
+import scipy.sparse
+
+from DataAnalytics.distances import _top_k
+from DataAnalytics.textual.words import count_stemmed_words, _word_ids
+from DataAnalytics.textual.hashing import WordHasher
+
+class QueryIndex(object):
+    """
+        Index to quickly query for similar documents in a term importance matrix.
+        Documents are ranked by cosine distance, just like query_to_index does by default.
+    """
+
+    def __init__(self, IDF, words, M):
+        """
+            Builds a new index.
+
+            IDF: IDF vector
+            words: Words the word count matrix consists of, or the WordHasher it was made with.
+            M: Term Importance matrix. May be dense or sparse.
+        """
+
+        self.IDF = np.asarray(IDF).ravel()
+
+        if isinstance(words, WordHasher):
+            self.words = words
+            self.word_ids = None
+        else:
+            self.words = list(words)
+            self.word_ids = _word_ids(self.words)
+
+        # keep floating point matrices in their precision
+        dtype = np.result_type(M.dtype, np.float32)
+
+        # each column of a csc matrix is the posting list of one word
+        P = scipy.sparse.csc_matrix(M, dtype=dtype, copy=True)
+
+        # normalise all documents, so that cosine similarity is a dot product
+        norms = np.sqrt(np.bincount(P.indices, weights=P.data ** 2, minlength=P.shape[0]))
+        norms[norms == 0] = 1
+        P.data /= norms[P.indices]
+
+        self.postings = P
+        self._rows = None
+
+    def __len__(self):
+        """
+            Returns the number of documents in this index.
+        """
+
+        return self.postings.shape[0]
+
+    def vectorize(self, query):
+        """
+            Turns a query into a sparse term importance vector.
+            Returns a pair of word indexes and their importance.
+
+            query: Query string to vectorize.
+        """
+
+        # hashed words need no lookup
+        if self.word_ids is None:
+            (ids, counts) = self.words.count(query)
+            return (ids, self.IDF[ids] * counts)
+
+        ids = []
+        counts = []
+
+        # count all the known words
+        for (w, c) in count_stemmed_words(query).items():
+            i = self.word_ids.get(w)
+            if i is not None:
+                ids.append(i)
+                counts.append(c)
+
+        ids = np.array(ids, dtype=np.int64)
+        return (ids, self.IDF[ids] * counts)
+
+    def query(self, query, k=10):
+        """
+            Queries for the documents closest to a query string.
+            Returns a pair of document indexes and cosine distances, closest first.
+
+            query: New document to search for.
+            k: Number of documents to return. If None, return all documents.
+        """
+
+        (ids, weights) = self.vectorize(query)
+
+        # only the posting lists of words in the query can contribute
+        similarities = np.zeros(len(self))
+        norm = np.linalg.norm(weights)
+        if norm > 0:
+            similarities += self.postings[:, ids] @ (weights / norm)
+
+        return _top_k(1 - similarities, k)
+
+    def query_batch(self, queries, k=10, chunk_size=None):
+        """
+            Queries for the documents closest to each of several query strings at once.
+            Returns a pair of matrices of document indexes and cosine distances, with one row per query, closest first.
+
+            queries: List of query strings to search for.
+            k: Number of documents to return per query. If None, return all documents.
+            chunk_size: Optional. Number of documents to score at once, bounding memory usage to about len(queries) * (chunk_size + k) distances.
+        """
+
+        Q = self.vectorize_batch(queries)
+
+        # documents are scored a chunk of rows at a time
+        n = len(self)
+        if k == None or k > n:
+            k = n
+        if chunk_size == None or chunk_size < 1:
+            chunk_size = max(n, 1)
+
+        # best documents found so far, sorted by distance and index
+        indexes = np.zeros((Q.shape[0], 0), dtype=np.int64)
+        distances = np.zeros((Q.shape[0], 0))
+
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+
+            # score all queries against this chunk with a single product, the transposed postings already are a csr matrix of all documents
+            if start == 0 and stop == n:
+                similarities = Q @ self.postings.T
+            else:
+                similarities = Q @ self.rows()[start:stop].T
+            similarities = scipy.sparse.csr_matrix(similarities)
+
+            # find the k best of them, breaking ties by index like query does
+            (columns, chunk_distances) = _top_k_similar(similarities, k)
+
+            # and merge them with the best ones so far, which all have smaller indexes
+            distances = np.hstack((distances, chunk_distances))
+            indexes = np.hstack((indexes, columns + start))
+
+            columns = _top_k_rows(distances, k)
+            distances = np.take_along_axis(distances, columns, axis=1)
+            indexes = np.take_along_axis(indexes, columns, axis=1)
+
+        return (indexes, distances)
+
+    def vectorize_batch(self, queries):
+        """
+            Turns several queries into a sparse matrix of normalised term importance vectors, one row per query.
+
+            queries: List of query strings to vectorize.
+        """
+
+        indptr = [0]
+        indices = []
+        data = []
+
+        for query in queries:
+            (ids, weights) = self.vectorize(query)
+
+            # normalise each query
+            norm = np.linalg.norm(weights)
+            if norm > 0:
+                weights = weights / norm
+
+            indices.append(ids)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(ids))
+
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        data = np.concatenate(data) if data else np.zeros(0)
+
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.IDF)))
+
+    def rows(self):
+        """
+            Returns the normalised documents as a csr matrix, one row per document.
+            The matrix is computed on first use.
+        """
+
+        if self._rows is None:
+            self._rows = self.postings.tocsr()
+
+        return self._rows
+
+def _top_k_rows(distances, k):
+    """
+        Selects the k smallest distances in each row of a matrix, like _top_k does for a vector.
+        Ties are broken by column and nans come last.
+        Returns a matrix of the selected columns of each row, sorted by distance and then column.
+
+        distances: Matrix of distances.
+        k: Number of distances to select per row.
+    """
+
+    if k >= distances.shape[1]:
+        return np.argsort(distances, axis=1, kind='stable')
+    if k < 1:
+        return np.zeros((distances.shape[0], 0), dtype=np.int64)
+
+    # find the k-th smallest distance of each row by partially sorting
+    kth = np.partition(distances, k - 1, axis=1)[:, k - 1:k]
+    nan_kth = np.isnan(kth)
+
+    # take everything closer, and as many of the first columns equal to it as there is room for
+    closer = np.where(nan_kth, ~np.isnan(distances), distances < kth)
+    equal = np.where(nan_kth, np.isnan(distances), distances == kth)
+
+    room = k - np.count_nonzero(closer, axis=1)[:, np.newaxis]
+    keep = closer | (equal & (np.cumsum(equal, axis=1) <= room))
+
+    columns = np.nonzero(keep)[1].reshape(-1, k)
+
+    # sort only the selected ones, a stable sort keeps ties in column order
+    order = np.argsort(np.take_along_axis(distances, columns, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1)
+
+def _top_k_similar(S, k):
+    """
+        Selects the k smallest cosine distances in each row of a sparse matrix of cosine similarities, like _top_k does for a vector.
+        Entries that are not stored have a similarity of 0, so only the stored entries and the first k columns at distance 1 need to be looked at.
+        Returns a pair of matrices of the selected columns and their distances, sorted by distance and then column.
+
+        S: Sparse csr matrix of similarities.
+        k: Number of distances to select per row.
+    """
+
+    (n, width) = S.shape
+    k = min(k, width)
+
+    columns = np.zeros((n, k), dtype=np.int64)
+    distances = np.ones((n, k), dtype=np.result_type(S.dtype, np.float32))
+
+    for r in range(n):
+        row = slice(S.indptr[r], S.indptr[r + 1])
+        d = 1 - S.data[row]
+
+        # entries at a distance other than 1, and the first columns at distance 1
+        other = d != 1
+        taken = S.indices[row][other]
+
+        free = np.ones(min(width, k + len(taken)), dtype=bool)
+        free[taken[taken < len(free)]] = False
+        ones = np.flatnonzero(free)[:k]
+
+        # select among the stored entries first, then merge in the ones at distance 1
+        (taken, d) = _top_k_columns(taken, d[other], k)
+
+        candidates = np.concatenate((taken, ones))
+        candidate_distances = np.concatenate((d, np.ones(len(ones), dtype=d.dtype)))
+
+        order = np.lexsort((candidates, candidate_distances))[:k]
+
+        columns[r] = candidates[order]
+        distances[r] = candidate_distances[order]
+
+    return (columns, distances)
+
+def _top_k_columns(columns, distances, k):
+    """
+        Selects the k smallest distances of entries of a row, breaking ties by column like _top_k does by index.
+        Returns a pair of the selected columns and their distances, in no particular order.
+
+        columns: Vector of columns of the entries, in any order.
+        distances: Vector of distances of the entries.
+        k: Number of entries to select.
+    """
+
+    if k >= len(distances):
+        return (columns, distances)
+    if k < 1:
+        return (columns[:0], distances[:0])
+
+    # find the k-th smallest distance by partially sorting
+    kth = np.partition(distances, k - 1)[k - 1]
+
+    # take everything closer, and the smallest columns of those equal to it (nans come last)
+    if np.isnan(kth):
+        (closer, equal) = (~np.isnan(distances), np.isnan(distances))
+    else:
+        (closer, equal) = (distances < kth, distances == kth)
+
+    tied = np.flatnonzero(equal)
+    tied = tied[np.argsort(columns[tied], kind='stable')[:k - np.count_nonzero(closer)]]
+
+    selected = np.concatenate((np.flatnonzero(closer), tied))
+    return (columns[selected], distances[selected])
@@ -0,0 +1,183 @@
+import numpy as np
+import scipy.sparse
+
+from DataAnalytics.textual.words import stem_word
+from DataAnalytics.textual.corpus import _count_documents, _WordCountMatrixBuilder
+
+class CorpusModel(object):
+    """
+        A word count matrix and term importance matrix that can be updated without recounting all documents.
+
+        At any time, words, M, IDF and TIM are exactly what
+        word_count_matrix(documents, stop_words=stop_words, sparse=True) and make_TIM would compute for the current documents.
+    """
+
+    def __init__(self, documents=(), stop_words=None):
+        """
+            Creates a new model.
+
+            documents: Optional. Array (or any other iterable) of initial documents.
+            stop_words: Optional. Words to ignore.
+        """
+
+        if stop_words == None:
+            self.stop_words = frozenset()
+        else:
+            self.stop_words = frozenset(map(stem_word, stop_words))
+
+        self._builder = _WordCountMatrixBuilder([])
+        self._n = 0
+
+        # number of documents each word occurs in
+        self.df = np.zeros(0, dtype=np.int64)
+
+        self._M = None
+        self._TIM = None
+
+        self.add_documents(documents)
+
+    def __len__(self):
+        """
+            Returns the number of documents in this model.
+        """
+
+        return self._n
+
+    @property
+    def words(self):
+        """
+            Words the word count matrix consists of.
+        """
+
+        return self._builder.words
+
+    @property
+    def M(self):
+        """
+            Word count matrix as a scipy.sparse.csr_matrix.
+        """
+
+        if self._M is None:
+            self._M = self._builder.matrix()
+
+            # keep the builder from concatenating the same rows again
+            self._builder.indptr = [self._M.indptr]
+            self._builder.indices = [self._M.indices]
+            self._builder.data = [self._M.data]
+
+        return self._M
+
+    @property
+    def IDF(self):
+        """
+            IDF vector of the current documents.
+        """
+
+        return np.log(len(self) / np.maximum(self.df, 1))
+
+    @property
+    def TIM(self):
+        """
+            Term importance matrix of the current documents as a scipy.sparse.csr_matrix.
+        """
+
+        if self._TIM is None:
+            IDF = self.IDF
+
+            TIM = scipy.sparse.csr_matrix(self.M, dtype=np.result_type(self.M.dtype, IDF.dtype), copy=True)
+            TIM.data *= IDF[TIM.indices]
+
+            self._TIM = TIM
+
+        return self._TIM
+
+    def add_documents(self, documents):
+        """
+            Adds documents to the end of this model.
+            Returns the indexes of the new documents.
+
+            documents: Array (or any other iterable) of strings to add.
+        """
+
+        start = len(self)
+
+        # count the new documents only
+        (words, indptr, indices, data) = _count_documents(documents)
+        (words, indptr, indices, data) = _drop_words(words, indptr, indices, data, self.stop_words)
+
+        self._builder.add((words, indptr, indices, data))
+        self._n += len(indptr) - 1
+
+        # update the document frequencies from the columns just added
+        self.df = np.concatenate((self.df, np.zeros(len(self.words) - len(self.df), dtype=np.int64)))
+        self.df += np.bincount(self._builder.indices[-1], minlength=len(self.words))
+
+        self._M = None
+        self._TIM = None
+
+        return np.arange(start, len(self))
+
+    def remove_documents(self, indexes):
+        """
+            Removes documents from this model. Words that no longer occur are removed as well.
+
+            indexes: Indexes of the documents to remove.
+        """
+
+        M = self.M
+        n = M.shape[0]
+
+        remove = np.zeros(n, dtype=bool)
+        remove[np.asarray(indexes, dtype=np.int64)] = True
+
+        # find the entries of the documents to keep, in their original order
+        lengths = np.diff(M.indptr)
+        keep_entries = np.repeat(~remove, lengths)
+
+        indices = M.indices[keep_entries]
+        data = M.data[keep_entries]
+        indptr = np.concatenate(([0], np.cumsum(lengths[~remove])))
+
+        # words are ordered by their first occurrence, which may have changed
+        (columns, first) = np.unique(indices, return_index=True)
+        order = columns[np.argsort(first)]
+
+        new_columns = np.zeros(len(self.words), dtype=np.int64)
+        new_columns[order] = np.arange(len(order))
+
+        # and rebuild the model
+        builder = _WordCountMatrixBuilder([self.words[i] for i in order])
+        builder.add_rows(indptr, new_columns[indices], data)
+
+        self.df = np.bincount(new_columns[indices], minlength=len(order))
+        self._builder = builder
+        self._n = len(indptr) - 1
+
+        self._M = None
+        self._TIM = None
+
+def _drop_words(words, indptr, indices, data, drop):
+    """
+        Removes words from counts as returned by _count_documents.
+
+        words: Words of the counts.
+        indptr: Index pointers of the rows.
+        indices: Columns of the entries.
+        data: Values of the entries.
+        drop: Set of words to remove.
+    """
+
+    if not drop:
+        return (words, indptr, indices, data)
+
+    # entries to keep
+    keep_words = np.array([not w in drop for w in words], dtype=bool)
+    keep = keep_words[indices]
+
+    # renumber the remaining words
+    columns = np.cumsum(keep_words) - 1
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=len(indptr) - 1))))
+
+    return ([w for (w, k) in zip(words, keep_words) if k], indptr, columns[indices[keep]], data[keep])
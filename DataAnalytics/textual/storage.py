@@ -0,0 +1,91 @@
+import os
+import json
+import numpy as np
+import scipy.sparse
+
+from DataAnalytics.textual.hashing import WordHasher
+
+def save_corpus(path, words, IDF=None, M=None, TIM=None):
+    """
+        Saves the outputs of word_count_matrix and make_TIM to a directory, so that they can be loaded (and memory-mapped) by load_corpus.
+        Each array is stored in its own .npy file.
+
+        path: Directory to save to. Created if it does not exist.
+        words: Words the word count matrix consists of, or the WordHasher it was made with.
+        IDF: Optional. IDF vector.
+        M: Optional. Word count matrix. May be dense or sparse.
+        TIM: Optional. Term importance matrix. May be dense or sparse.
+    """
+
+    os.makedirs(path, exist_ok=True)
+
+    meta = {"matrices": {}}
+
+    # store the words or the hasher
+    if isinstance(words, WordHasher):
+        meta["hasher"] = {
+            "n_features": words.n_features,
+            "signed": words.signed,
+            "stop_words": sorted(words.stop_words)
+        }
+    else:
+        meta["words"] = list(words)
+
+    if IDF is not None:
+        np.save(os.path.join(path, "IDF.npy"), np.asarray(IDF))
+        meta["IDF"] = True
+
+    # store each matrix
+    for (name, A) in (("M", M), ("TIM", TIM)):
+        if A is None:
+            continue
+
+        if scipy.sparse.issparse(A):
+            A = scipy.sparse.csr_matrix(A)
+            for part in ("data", "indices", "indptr"):
+                np.save(os.path.join(path, "%s.%s.npy" % (name, part)), getattr(A, part))
+            meta["matrices"][name] = {"format": "csr", "shape": list(A.shape)}
+        else:
+            np.save(os.path.join(path, "%s.npy" % name), np.asarray(A))
+            meta["matrices"][name] = {"format": "dense"}
+
+    # write the metadata last, so that incomplete directories are not loaded
+    with open(os.path.join(path, "corpus.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def load_corpus(path, mmap=True):
+    """
+        Loads a corpus saved by save_corpus.
+        Returns a tuple (words, IDF, M, TIM), where parts that were not saved are None.
+
+        path: Directory to load from.
+        mmap: If set to True, memory-map all arrays read-only instead of reading them into memory, so that several processes share one copy through the page cache. Defaults to True.
+    """
+
+    with open(os.path.join(path, "corpus.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+
+    mmap_mode = 'r' if mmap else None
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+    # restore the words or the hasher
+    if "hasher" in meta:
+        words = WordHasher(n_features=meta["hasher"]["n_features"], signed=meta["hasher"]["signed"])
+        words.stop_words = frozenset(meta["hasher"]["stop_words"])
+    else:
+        words = meta["words"]
+
+    IDF = load("IDF") if meta.get("IDF") else None
+
+    # and all the matrices
+    matrices = {}
+    for (name, info) in meta["matrices"].items():
+        if info["format"] == "csr":
+            parts = (load(name + ".data"), load(name + ".indices"), load(name + ".indptr"))
+            matrices[name] = scipy.sparse.csr_matrix(parts, shape=tuple(info["shape"]), copy=False)
+        else:
+            matrices[name] = load(name)
+
+    return (words, IDF, matrices.get("M"), matrices.get("TIM"))
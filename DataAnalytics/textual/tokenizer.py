@@ -0,0 +1,57 @@
+import re
+
+VOWELS = ["a", "e", "i", "o", "u"]
+VOWELSS = VOWELS + ["s"]
+TERMINATORS = [",", ";", ".", ":", "?", "!", "-", "&", "(", ")"]
+
+# a single pass over a text finds all words.
+# whitespace and "-()" only separate words, while "+[]{}" count as words of their own.
+TOKEN_RE = re.compile('[^\\s\\+\\-\\(\\)\\[\\]\\{\\}]+|[\\+\\[\\]\\{\\}]')
+
+# terminators are stripped from the end of a word, each at most once and in the order of TERMINATORS.
+TERMINATOR_RE = re.compile(''.join(re.escape(t) + '?' for t in reversed(TERMINATORS)) + '\\Z')
+
+def split_words(text):
+    """
+        Splits a text string into a list of (unstemmed) words.
+
+        text: String to split.
+    """
+
+    return TOKEN_RE.findall(text)
+
+def stem(word):
+    """
+        Turns a word into its stem word, without using any cache.
+
+        word: Word to stem.
+    """
+
+    # strip off whitespaces and remove all the terminating characters
+    word = TERMINATOR_RE.sub('', word.lower().strip(), count=1)
+
+    # check if the word ends with s and a non-s vowl
+    if word.endswith("s") and len(word) > 1:
+        if not word[-2] in VOWELSS:
+            word = word[:-1]
+
+    # if the word ends in es, drop the s
+    if word.endswith("es"):
+        word = word[:-1]
+
+    # remove ing
+    if word.endswith("ing"):
+        _word = word[:-3]
+        if _word != "th" and len(_word) > 1:
+            word = _word
+
+    # if a word ends with ed
+    if word.endswith("ed"):
+        if len(word) > 3:
+            word = word[:-2]
+
+    # ies
+    if word.endswith("ies") and (not word.endswith("eies") or not word.endswith("aies")):
+        word = word[:-3]+"y"
+
+    return word
@@ -1,12 +1,61 @@
-import re
+import json
+from collections import Counter
 
-from DataAnalytics.textual.stopwords import STOP_WORDS
+from DataAnalytics.cache import LRUCache
+from DataAnalytics.textual.stopwords import STOP_WORDS, STOP_WORD_SET
+from DataAnalytics.textual.tokenizer import VOWELS, VOWELSS, TERMINATORS, split_words, stem as _stem
 
-VOWELS = ["a", "e", "i", "o", "u"]
-VOWELSS = VOWELS + ["s"]
-TERMINATORS = [",", ";", ".", ":", "?", "!", "-", "&", "(", ")"]
+# default maximal number of cached stem words
+STEM_CACHE_SIZE = 100000
 
-stem_word_cache = {}
+# shared by all threads, so guarded by a lock
+stem_word_cache = LRUCache(maxsize=STEM_CACHE_SIZE, thread_safe=True)
+
+def configure_stem_cache(maxsize=STEM_CACHE_SIZE, thread_safe=True):
+    """
+        Replaces the cache of stem words with a new, empty one.
+
+        maxsize: Maximal number of stem words to cache. If None, the cache is unbounded. Defaults to STEM_CACHE_SIZE.
+        thread_safe: If set to True, the cache can be shared across threads. Only turn this off if stem_word is never called from several threads at once. Defaults to True.
+    """
+
+    global stem_word_cache
+    stem_word_cache = LRUCache(maxsize=maxsize, thread_safe=thread_safe)
+
+    return stem_word_cache
+
+def warm_stem_cache(filename, encoding='utf-8'):
+    """
+        Pre-fills the cache of stem words from a vocabulary file with one word per line.
+
+        filename: Path of vocabulary file to read.
+        encoding: Encoding of the file. Defaults to 'utf-8'.
+    """
+
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            stem_word(line.rstrip('\r\n'))
+
+def save_stem_cache(filename):
+    """
+        Saves the cache of stem words to a file, so that it can be loaded after a restart.
+
+        filename: Path of file to write.
+    """
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(stem_word_cache.items(), f)
+
+def load_stem_cache(filename):
+    """
+        Loads stem words saved by save_stem_cache into the cache.
+
+        filename: Path of file to read.
+    """
+
+    with open(filename, encoding='utf-8') as f:
+        for (word, stem) in json.load(f):
+            stem_word_cache[word] = stem
 
 def stem_word(word):
     """
@@ -16,68 +65,44 @@ def stem_word(word):
     """
 
     # if we have the stemmed word cached, return that
-    if word in stem_word_cache:
-        return stem_word_cache[word]
-    original_word = word
-
-    # strip off whitespaces
-    word = word.lower().strip()
-
-    # remove all the terminating characters
-    for t in TERMINATORS:
-        if word.endswith(t):
-            word = word[:-len(t)]
-
-    # check if the word ends with s and a non-s vowl
-    if word.endswith("s") and len(word) > 1:
-        if not word[-2] in VOWELSS:
-            word = word[:-1]
-
-    # if the word ends in es, drop the s
-    if word.endswith("es"):
-        word = word[:-1]
-
-    # remove ing
-    if word.endswith("ing"):
-        _word = word[:-3]
-        if _word != "th" and len(_word) > 1:
-            word = _word
-
-    # if a word ends with ed
-    if word.endswith("ed"):
-        if len(word) > 3:
-            word = word[:-2]
-
-    # ies
-    if word.endswith("ies") and (not word.endswith("eies") or not word.endswith("aies")):
-        word = word[:-3]+"y"
+    stem = stem_word_cache.get(word)
+    if stem is not None:
+        return stem
+
+    stem = _stem(word)
 
     # cache the word
-    stem_word_cache[original_word] = word
+    stem_word_cache[word] = stem
 
     # and retun it
-    return word
+    return stem
 
-def find_words(text):
+def stem_words(words):
     """
-        Finds all words in some text string.
+        Turns a list of words into their stem words, stemming each distinct word only once.
 
-        text: String to find all words in.
+        words: Words to stem.
     """
 
-    # words we want to find
-    words = []
+    stems = {}
+    result = []
 
-    # split all the worlds and map them
-    text_words = re.split('\\s+', text)
+    for w in words:
+        s = stems.get(w)
+        if s is None:
+            s = stems[w] = stem_word(w)
+        result.append(s)
 
-    # stem all the words
-    text_words = map(stem_word, text_words)
+    return result
 
-    # remove stop words
-    text_words = filter(lambda x:not x in STOP_WORDS, text_words)
+def find_words(text):
+    """
+        Finds all words in some text string.
 
-    return list(set(text_words))
+        text: String to find all words in.
+    """
+
+    return list(set(stemmed_words(text)))
 
 def count_words(text, words):
     """
@@ -87,8 +112,18 @@ def count_words(text, words):
         words: Words to count.
     """
 
-    (nw, counts) = count_all_words(text, and_words = words)
-    return counts[:len(words)]
+    # find the index of each word
+    word_ids = _word_ids(words)
+
+    # and a word count_vector
+    word_counts = [0]*len(words)
+
+    for (t, c) in count_stemmed_words(text).items():
+        i = word_ids.get(t)
+        if i is not None:
+            word_counts[i] += c
+
+    return word_counts
 
 
 def count_all_words(text, and_words = []):
@@ -100,31 +135,56 @@ def count_all_words(text, and_words = []):
     """
 
     # initialise a list of words
-    words = list(and_words)[:]
+    words = list(and_words)
+    word_ids = _word_ids(words)
 
     # and a word count_vector
-    word_counts = [0 for i in words]
-
-    # split all the worlds and map them
-    text_words = re.split('(\\s+|[\\+\\-\\(\\)\\[\\]\\{\\}])', text)
-
-    # stem all the words
-    text_words = map(stem_word, text_words)
-
-    # remove stop words
-    text_words = filter(lambda x:not x in STOP_WORDS, text_words)
+    word_counts = [0]*len(words)
 
     # go over each of the text words
-    for t in text_words:
+    for (t, c) in count_stemmed_words(text).items():
+        i = word_ids.get(t)
 
         # if it is already there, simply increase the count
-        try:
-            i = words.index(t)
-            word_counts[i] += 1
+        if i is not None:
+            word_counts[i] += c
 
         # if not append them
-        except:
+        else:
             words.append(t)
-            word_counts.append(1)
+            word_counts.append(c)
 
     return (words, word_counts)
+
+def count_stemmed_words(text):
+    """
+        Counts the stemmed words in a string, leaving out stop words.
+        Returns a Counter ordered by first occurrence of each word.
+
+        text: Text to count words in.
+    """
+
+    return Counter(stemmed_words(text))
+
+def stemmed_words(text):
+    """
+        Splits a string into a list of stemmed words, leaving out stop words.
+
+        text: Text to split.
+    """
+
+    # stem all the words and remove stop words
+    return [w for w in stem_words(split_words(text)) if not w in STOP_WORD_SET]
+
+def _word_ids(words):
+    """
+        Maps each word to the index of its first occurrence.
+
+        words: List of words to map.
+    """
+
+    word_ids = {}
+    for (i, w) in enumerate(words):
+        word_ids.setdefault(w, i)
+
+    return word_ids
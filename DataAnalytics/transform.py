@@ -1,13 +1,19 @@
 import numpy
-import matplotlib.mlab
+import scipy.linalg
+import scipy.sparse
+from scipy.spatial.distance import cdist
 from sklearn import manifold
 
+from DataAnalytics.distances import CondensedDistanceMatrix, _KERNELS
+from DataAnalytics.chunks import _row_chunks, _stack_rows
+
 # (c) Tom Wiesing 2015
 # licensed under MIT license
 
 def PCA(M,axis=1):
     """
         Applies an unscaled PCA to a matrix.
+        Returns a new matrix, M is left untouched.
 
         M: Matrix to apply PCA to.
         axis: Axis to normalise against. Needs to be either 1 or 0. Defaults to 1.
@@ -23,27 +29,341 @@ def PCA(M,axis=1):
     else:
         P = M
 
-    # compute a PCA object
-    pcaobj = matplotlib.mlab.PCA(P,standardize=False)
-
-    # replace each row of the matrix P
-    for r in range(P.shape[0]):
-        P[r, :] = pcaobj.project(P[r, :])
+    # project all rows of P at once
+    Q = PrincipalComponents().fit_transform(P)
 
     # and return the right version.
     if axis == 1:
-        return P.T
+        return Q.T
     else:
-        return P
+        return Q
+
+class PrincipalComponents(object):
+    """
+        An unscaled PCA that is fitted once and can then project any number of rows.
+        Rows are centered by the mean of the fitted rows and projected onto the principal axes, i.e. (x - mean) @ components.T.
+    """
+
+    def __init__(self, n_components=None, randomized=None, n_oversamples=10, n_iter=4, seed=None):
+        """
+            Creates a new, unfitted PCA.
+
+            n_components: Optional. Number of components to keep. Defaults to all of them.
+            randomized: If set to True, compute the components with a randomized SVD, which is much faster when n_components is small compared to the size of the matrix.
+                If None, do so exactly when n_components is less than 80% of the smaller dimension of a matrix with more than 500 rows or columns. Defaults to None.
+            n_oversamples: Number of extra random directions to sample in a randomized SVD. Defaults to 10.
+            n_iter: Number of power iterations of a randomized SVD. More iterations give more accurate components. Defaults to 4.
+            seed: Random number generator seed to use for a randomized SVD. Optional.
+        """
+
+        self.n_components = n_components
+        self.randomized = randomized
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.seed = seed
+
+    def fit(self, M):
+        """
+            Computes the principal components of the rows of a matrix.
+            Returns this PCA.
+
+            M: Matrix to fit. May be sparse.
+        """
+
+        (n, m) = M.shape
+        k = min(n, m) if self.n_components == None else min(self.n_components, n, m)
+
+        randomized = self.randomized
+        if randomized == None:
+            randomized = k < 0.8 * min(n, m) and max(n, m) > 500
+
+        self.mean = numpy.asarray(M.mean(axis=0), dtype=numpy.result_type(M.dtype, numpy.float32)).ravel()
+
+        if randomized:
+            (s, Vh) = _randomized_svd(M, self.mean, k, self.n_oversamples, self.n_iter, self.seed)
+            total = _sum_of_squares(M) - n * numpy.dot(self.mean, self.mean)
+        else:
+            # centering makes a copy, so M is never changed
+            (_, s, Vh) = numpy.linalg.svd(_dense(M) - self.mean, full_matrices=False)
+            total = numpy.sum(s ** 2)
+            (s, Vh) = (s[:k], Vh[:k])
+
+        self.components = Vh
+        self.singular_values = s
+        self.explained_variance = s ** 2 / max(n - 1, 1)
+        self.explained_variance_ratio = s ** 2 / total if total > 0 else numpy.zeros_like(s)
+
+        # projection of the mean, to center rows after instead of before projecting them
+        self._offset = numpy.dot(self.components, self.mean)
+
+        return self
+
+    def transform(self, M):
+        """
+            Projects rows onto the principal components with a single matrix product.
+            Returns a new matrix with one row per row of M and one column per component.
+
+            M: Matrix of rows to project. May be sparse.
+        """
+
+        return numpy.asarray(M @ self.components.T) - self._offset
+
+    def fit_transform(self, M):
+        """
+            Fits this PCA to a matrix and projects its rows.
+
+            M: Matrix to fit and project. May be sparse.
+        """
+
+        return self.fit(M).transform(M)
+
+    def inverse_transform(self, Y):
+        """
+            Maps projected rows back into the original space.
+
+            Y: Matrix of projected rows.
+        """
+
+        return numpy.asarray(Y) @ self.components + self.mean
+
+class IncrementalPrincipalComponents(PrincipalComponents):
+    """
+        A PrincipalComponents that is fitted one chunk of rows at a time, so that it never needs all rows in memory.
+        Uses the incremental SVD of Ross et al., which keeps only the current components, the mean and the variance between chunks.
+        Memory use is bounded by the chunk size times the number of columns.
+    """
+
+    def __init__(self, n_components=None, batch_size=None):
+        """
+            Creates a new, unfitted PCA.
+
+            n_components: Optional. Number of components to keep. Defaults to the number of columns.
+            batch_size: Optional. Number of rows to fit at a time when fitting a whole matrix. Defaults to five times the number of columns.
+        """
+
+        self.n_components = n_components
+        self.batch_size = batch_size
+
+        self._reset()
+
+    def _reset(self):
+        """
+            Forgets all rows seen so far.
+        """
+
+        self.n_samples = 0
+
+        # rows seen before there are enough of them for the first decomposition
+        self._pending = []
+
+        for name in ("mean", "var", "components", "singular_values", "explained_variance", "explained_variance_ratio", "_offset"):
+            self.__dict__.pop(name, None)
+
+    def partial_fit(self, M):
+        """
+            Updates the components with a chunk of rows.
+            Returns this PCA.
+
+            M: Chunk of rows. May be sparse.
+        """
+
+        k = M.shape[1] if self.n_components == None else self.n_components
+
+        # wait for enough rows for the first decomposition
+        if self.n_samples == 0:
+            self._pending.append(M)
+            if sum(P.shape[0] for P in self._pending) < k:
+                return self
+
+            M = _stack_rows(self._pending)
+            self._pending = []
+
+        return self._update(M, k)
+
+    def _update(self, M, k):
+        """
+            Updates the components with a chunk of rows, keeping at most k of them.
+            Returns this PCA.
+
+            M: Chunk of rows. May be sparse.
+            k: Number of components to keep.
+        """
+
+        X = _dense(M)
+        X = X.astype(numpy.result_type(X.dtype, numpy.float32), copy=False)
+
+        n = X.shape[0]
+        total = self.n_samples + n
+
+        # update the mean and variance of the columns
+        batch_mean = X.mean(axis=0)
+        batch_var = X.var(axis=0)
+
+        if self.n_samples == 0:
+            (mean, var) = (batch_mean, batch_var)
+        else:
+            delta = batch_mean - self.mean
+            mean = self.mean + delta * (n / total)
+            var = (self.var * self.n_samples + batch_var * n + delta ** 2 * (self.n_samples * n / total)) / total
+
+        # decompose the current components together with the centered chunk, correcting for the shift of the mean
+        X = X - batch_mean
+        if self.n_samples > 0:
+            correction = numpy.sqrt(self.n_samples * n / total) * (self.mean - batch_mean)
+            X = numpy.vstack((self.singular_values[:, numpy.newaxis] * self.components, X, correction))
+
+        (_, s, Vh) = numpy.linalg.svd(X, full_matrices=False)
+        (s, Vh) = (s[:k], Vh[:k])
+
+        self.n_samples = total
+        self.mean = mean
+        self.var = var
+
+        self.components = Vh
+        self.singular_values = s
+        self.explained_variance = s ** 2 / max(total - 1, 1)
+        self.explained_variance_ratio = s ** 2 / numpy.sum(var * total) if numpy.any(var > 0) else numpy.zeros_like(s)
+
+        self._offset = numpy.dot(self.components, self.mean)
+
+        return self
+
+    def fit(self, M):
+        """
+            Computes the principal components of all rows of a matrix or all chunks of an iterator, one chunk at a time.
+            Rows seen by earlier calls to fit or partial_fit are forgotten.
+            Returns this PCA.
+
+            M: Matrix (possibly sparse or memory-mapped), or iterable of chunks of rows.
+        """
+
+        self._reset()
+
+        batch_size = self.batch_size
+        if batch_size == None and hasattr(M, 'shape'):
+            batch_size = 5 * M.shape[1]
+
+        for chunk in _row_chunks(M, batch_size):
+            self.partial_fit(chunk)
+
+        # with fewer rows than components, decompose what there is
+        if self._pending:
+            P = _stack_rows(self._pending)
+            self._pending = []
+            self._update(P, P.shape[1] if self.n_components == None else self.n_components)
+
+        if self.n_samples == 0:
+            raise ValueError("Can not fit a PCA without any rows")
+
+        return self
+
+    def transform(self, M, out=None, chunk_size=65536):
+        """
+            Projects rows onto the principal components, one chunk at a time.
+            Returns a matrix with one row per row of M and one column per component.
+
+            M: Matrix (possibly sparse or memory-mapped), or iterable of chunks of rows.
+            out: Optional. Matrix, e.g. a numpy.memmap, to write the projected rows to. Needs exactly one row per row of M.
+            chunk_size: Number of rows of a matrix to project at a time. Defaults to 65536.
+        """
+
+        chunks = (PrincipalComponents.transform(self, chunk) for chunk in _row_chunks(M, chunk_size))
+
+        if out is None:
+            chunks = list(chunks)
+            return numpy.vstack(chunks) if chunks else numpy.zeros((0, len(self.components)), dtype=self.components.dtype)
+
+        start = 0
+        for Y in chunks:
+            out[start:start + Y.shape[0]] = Y
+            start += Y.shape[0]
+
+        return out
+
+    def fit_transform(self, M):
+        """
+            Fits this PCA to a matrix and projects its rows.
+
+            M: Matrix to fit and project. May be sparse or memory-mapped. Iterators can only be passed over once, so use fit and transform separately for those.
+        """
+
+        if not hasattr(M, 'shape'):
+            raise ValueError("fit_transform needs a matrix, use fit and transform separately for iterables of chunks")
+
+        return self.fit(M).transform(M)
+
+def _randomized_svd(M, mean, k, n_oversamples, n_iter, seed):
+    """
+        Computes the top k singular values and right singular vectors of M - mean without centering M.
+        Returns a pair (s, Vh).
+
+        M: Matrix to decompose. May be sparse.
+        mean: Row to subtract from every row of M.
+        k: Number of singular values to compute.
+        n_oversamples: Number of extra random directions to sample.
+        n_iter: Number of power iterations.
+        seed: Random number generator seed to use.
+    """
+
+    (n, m) = M.shape
+    l = min(k + n_oversamples, n, m)
+
+    # products with the centered matrix and its transpose
+    def right(W):
+        return numpy.asarray(M @ W) - mean @ W
+
+    def left(Z):
+        return numpy.asarray(M.T @ Z) - numpy.outer(mean, Z.sum(axis=0))
+
+    # find an orthonormal basis of the range of the centered matrix
+    rng = numpy.random.default_rng(seed)
+    Q = right(rng.standard_normal((m, l)).astype(mean.dtype))
+
+    for _ in range(n_iter):
+        (Q, _) = numpy.linalg.qr(Q)
+        (Z, _) = numpy.linalg.qr(left(Q))
+        Q = right(Z)
+
+    (Q, _) = numpy.linalg.qr(Q)
+
+    # and decompose the matrix restricted to it
+    (_, s, Vh) = numpy.linalg.svd(left(Q).T, full_matrices=False)
+
+    return (s[:k], Vh[:k])
+
+def _sum_of_squares(M):
+    """
+        Returns the sum of the squares of all entries of a matrix.
+
+        M: Matrix to sum up. May be sparse.
+    """
+
+    if scipy.sparse.issparse(M):
+        return M.multiply(M).sum()
+
+    M = numpy.asarray(M)
+    return numpy.einsum('ij,ij->', M, M)
+
+def _dense(M):
+    """
+        Returns a matrix as a dense array.
+
+        M: Matrix to convert. May be sparse.
+    """
+
+    return M.toarray() if scipy.sparse.issparse(M) else numpy.asarray(M)
 
 def MDS(M, n, seed=None):
     """
         Applies an (metric) MDS transform to a similarities matrix.
 
-        M: Matrix to tranform.
+        M: Matrix to tranform. May be a CondensedDistanceMatrix.
         n: Dimensionality of embedded space.
     """
 
+    if isinstance(M, CondensedDistanceMatrix):
+        M = M.toarray()
+
     mds_obj = manifold.MDS(n_components=n, dissimilarity="precomputed", random_state=seed)
     return mds_obj.fit_transform(M)
 
@@ -51,14 +371,222 @@ def NMDS(M, n, seed=None):
     """
         Applies an nonmetric MDS transform to a similarities matrix.
 
-        M: Matrix to tranform.
+        M: Matrix to tranform. May be a CondensedDistanceMatrix.
         n: Dimensionality of embedded space.
         seed: Random number generator seed to use. Optional.
     """
 
+    if isinstance(M, CondensedDistanceMatrix):
+        M = M.toarray()
+
     mds_obj = manifold.MDS(metric=False, n_init=1, n_components=n, dissimilarity="precomputed", random_state=seed)
     return mds_obj.fit_transform(M)
 
+def classical_MDS(M, n):
+    """
+        Applies a classical (Torgerson) MDS transform to a distance matrix, using only the top n eigenvectors.
+        Much faster than MDS, but only exact for euclidean distances.
+
+        M: Matrix to tranform. May be a CondensedDistanceMatrix.
+        n: Dimensionality of embedded space.
+    """
+
+    if isinstance(M, CondensedDistanceMatrix):
+        M = M.toarray()
+
+    (coordinates, _, _) = _classical_MDS(numpy.asarray(M, dtype=float) ** 2, n)
+    return coordinates
+
+def landmark_MDS(M, n, n_landmarks=100, d='euclidean', maxmin=False, fast=False, seed=None):
+    """
+        Applies a landmark MDS transform, which only needs the distances of all elements to a few landmark elements.
+        The full distance matrix is never computed.
+
+        M: Matrix of elements (one per row) to embed, or a CondensedDistanceMatrix of precomputed distances.
+        n: Dimensionality of embedded space.
+        n_landmarks: Number of landmarks to use, at least n + 1. Defaults to 100.
+        d: Distance metric to use. Ignored for a CondensedDistanceMatrix.
+        maxmin: If set to True, choose each landmark as far away as possible from the previous ones instead of at random. Defaults to False.
+        fast: If set to True, compute euclidean and cosine distances using matrix products. Defaults to False.
+        seed: Random number generator seed to use. Optional.
+    """
+
+    return LandmarkMDS(n, n_landmarks=n_landmarks, d=d, maxmin=maxmin, fast=fast, seed=seed).fit_transform(M)
+
+class LandmarkMDS(object):
+    """
+        A landmark MDS (de Silva and Tenenbaum), embedding elements by classical MDS of a few landmarks and triangulation from their distances to these.
+        Once fitted, embeds new elements without refitting.
+    """
+
+    def __init__(self, n, n_landmarks=100, d='euclidean', maxmin=False, fast=False, seed=None):
+        """
+            Creates a new, unfitted embedding.
+
+            n: Dimensionality of embedded space.
+            n_landmarks: Number of landmarks to use, at least n + 1. Defaults to 100.
+            d: Distance metric to use. Ignored for a CondensedDistanceMatrix.
+            maxmin: If set to True, choose each landmark as far away as possible from the previous ones instead of at random. Defaults to False.
+            fast: If set to True, compute euclidean and cosine distances using matrix products. Defaults to False.
+            seed: Random number generator seed to use. Optional.
+        """
+
+        self.n = n
+        self.n_landmarks = n_landmarks
+        self.d = d
+        self.maxmin = maxmin
+        self.fast = fast
+        self.seed = seed
+
+    def fit(self, M, landmarks=None):
+        """
+            Chooses landmarks among elements and embeds them.
+            Returns this embedding.
+
+            M: Matrix of elements (one per row), or a CondensedDistanceMatrix of precomputed distances.
+            landmarks: Optional. Indexes of elements to use as landmarks instead of choosing them.
+        """
+
+        if landmarks is None:
+            landmarks = self._choose_landmarks(M)
+        self.landmarks = numpy.asarray(landmarks, dtype=numpy.int64)
+
+        # distances between the landmarks
+        if isinstance(M, CondensedDistanceMatrix):
+            self.landmark_elements = None
+            D = M.rows(self.landmarks)[:, self.landmarks]
+        else:
+            self.landmark_elements = M[self.landmarks]
+            D = self.distances(self.landmark_elements)
+
+        # embed the landmarks
+        D2 = numpy.asarray(D, dtype=float) ** 2
+        (self.landmark_coordinates, values, vectors) = _classical_MDS(D2, self.n)
+
+        # and prepare to triangulate everything else from them
+        self._mean = D2.mean(axis=0)
+        self._pinv = vectors / numpy.sqrt(values)
+
+        return self
+
+    def distances(self, M):
+        """
+            Returns the distances of elements to the landmarks, one row per element.
+
+            M: Matrix of elements, one per row.
+        """
+
+        return self._distances(M, self.landmark_elements)
+
+    def _distances(self, M, L):
+        """
+            Returns the distances of elements to other elements, one row per element.
+
+            M: Matrix of elements, one per row.
+            L: Matrix of other elements, one per row.
+        """
+
+        # the kernels only take dense matrices, too
+        if self.fast and self.d in _KERNELS:
+            return _KERNELS[self.d](_dense(M), _dense(L))
+
+        return cdist(_dense(M), _dense(L), self.d)
+
+    def transform(self, M, chunk_size=65536):
+        """
+            Embeds elements, one chunk at a time.
+            Returns a matrix with one row per element and (at most) n columns.
+
+            M: Matrix (possibly sparse or memory-mapped) of new elements, one per row, or iterable of chunks of rows.
+            chunk_size: Number of rows of a matrix to embed at a time. Defaults to 65536.
+        """
+
+        if self.landmark_elements is None:
+            raise ValueError("Embedding was fitted to precomputed distances, use transform_distances instead")
+
+        chunks = [self.transform_distances(self.distances(chunk)) for chunk in _row_chunks(M, chunk_size)]
+        return numpy.vstack(chunks) if chunks else numpy.zeros((0, self._pinv.shape[1]))
+
+    def transform_distances(self, D):
+        """
+            Embeds elements given their distances to the landmarks.
+            Returns a matrix with one row per element and (at most) n columns.
+
+            D: Matrix of distances of elements to the landmarks, one row per element and one column per landmark.
+        """
+
+        return -0.5 * (numpy.asarray(D, dtype=float) ** 2 - self._mean) @ self._pinv
+
+    def fit_transform(self, M, landmarks=None):
+        """
+            Fits this embedding and embeds all elements.
+
+            M: Matrix of elements (one per row), or a CondensedDistanceMatrix of precomputed distances.
+            landmarks: Optional. Indexes of elements to use as landmarks instead of choosing them.
+        """
+
+        self.fit(M, landmarks=landmarks)
+
+        if isinstance(M, CondensedDistanceMatrix):
+            return numpy.vstack([
+                self.transform_distances(M.rows(range(start, min(start + 1024, M.n)))[:, self.landmarks]) for start in range(0, M.n, 1024)
+            ])
+
+        return self.transform(M)
+
+    def _choose_landmarks(self, M):
+        """
+            Returns the indexes of n_landmarks elements to use as landmarks.
+
+            M: Matrix of elements (one per row), or a CondensedDistanceMatrix of precomputed distances.
+        """
+
+        N = M.shape[0]
+        k = min(self.n_landmarks, N)
+        rng = numpy.random.default_rng(self.seed)
+
+        if not self.maxmin:
+            return numpy.sort(rng.choice(N, size=k, replace=False))
+
+        # start at random, then keep adding the element furthest away from all landmarks so far
+        landmarks = [int(rng.integers(N))]
+        closest = numpy.full(N, numpy.inf)
+
+        for _ in range(k - 1):
+            if isinstance(M, CondensedDistanceMatrix):
+                D = M.row(landmarks[-1])
+            else:
+                # a chunk of rows at a time, so that sparse matrices are never densified as a whole
+                L = M[landmarks[-1:]]
+                D = numpy.concatenate([self._distances(chunk, L).ravel() for chunk in _row_chunks(M, 65536)])
+
+            closest = numpy.minimum(closest, D)
+            landmarks.append(int(numpy.argmax(closest)))
+
+        return numpy.array(landmarks)
+
+def _classical_MDS(D2, n):
+    """
+        Applies classical MDS to a matrix of squared distances.
+        Returns a tuple of the coordinates, the n largest eigenvalues and their eigenvectors. Non-positive eigenvalues are dropped.
+
+        D2: Square matrix of squared distances.
+        n: Dimensionality of embedded space.
+    """
+
+    # double centering
+    B = -0.5 * (D2 - D2.mean(axis=0) - D2.mean(axis=1)[:, numpy.newaxis] + D2.mean())
+
+    # only compute the top n eigenvectors, largest first
+    m = B.shape[0]
+    (values, vectors) = scipy.linalg.eigh(B, subset_by_index=(max(m - n, 0), m - 1))
+    (values, vectors) = (values[::-1], vectors[:, ::-1])
+
+    positive = values > 1e-12 * max(values[0], 1)
+    (values, vectors) = (values[positive], vectors[:, positive])
+
+    return (vectors * numpy.sqrt(values), values, vectors)
+
 def permute(M,sigma,axis=1):
     """
         Reorders data items according to a permutation sigma.
@@ -0,0 +1,42 @@
+"""
+    Benchmarks the matrix product distance kernels against scipy's pdist.
+
+    Run as: python benchmarks/distances.py [dimension]
+"""
+
+import sys
+import time
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+from DataAnalytics.distances import euclidean_distance_matrix, cosine_distance_matrix
+
+def timed(fn):
+    """
+        Returns the result of fn() and the time it took.
+
+        fn: Function to call.
+    """
+
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+if __name__ == '__main__':
+    dim = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = np.random.default_rng(42)
+
+    print("%-10s %6s %10s %10s %10s %12s %12s" % ("metric", "n", "pdist", "float64", "float32", "error64", "error32"))
+
+    for n in [500, 1000, 2000, 4000]:
+        X = rng.standard_normal((n, dim))
+
+        for (metric, kernel) in [("euclidean", euclidean_distance_matrix), ("cosine", cosine_distance_matrix)]:
+            (reference, t_pdist) = timed(lambda: squareform(pdist(X, metric)))
+            (D64, t64) = timed(lambda: kernel(X))
+            (D32, t32) = timed(lambda: kernel(X, dtype=np.float32))
+
+            print("%-10s %6d %9.3fs %9.3fs %9.3fs %12.2e %12.2e" % (
+                metric, n, t_pdist, t64, t32,
+                np.max(np.abs(D64 - reference)), np.max(np.abs(D32 - reference))
+            ))
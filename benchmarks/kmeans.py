@@ -0,0 +1,55 @@
+"""
+    Benchmarks mini-batch k-means against k_means on random blobs.
+
+    Run as: python benchmarks/kmeans.py [k]
+"""
+
+import sys
+import time
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.metrics import adjusted_rand_score
+
+from DataAnalytics.clustering import k_means, mini_batch_k_means
+
+def timed(fn):
+    """
+        Returns the result of fn() and the time it took.
+
+        fn: Function to call.
+    """
+
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+def inertia(M, labels):
+    """
+        Returns the sum of squared distances of rows to the mean of their cluster.
+
+        M: Matrix that was clustered.
+        labels: Cluster of each row.
+    """
+
+    total = 0.0
+    for l in np.unique(labels):
+        rows = M[labels == l]
+        total += np.sum((rows - rows.mean(axis=0)) ** 2)
+
+    return total
+
+if __name__ == '__main__':
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print("%8s %10s %10s %14s %14s %8s %8s" % ("n", "k_means", "minibatch", "inertia", "inertia mb", "ARI", "ARI mb"))
+
+    for n in [10000, 100000, 500000]:
+        (M, truth) = make_blobs(n_samples=n, n_features=50, centers=k, random_state=42)
+
+        (labels, t_full) = timed(lambda: k_means(M, k, seed=42))
+        (labels_mb, t_mb) = timed(lambda: mini_batch_k_means(M, k, seed=42))
+
+        print("%8d %9.3fs %9.3fs %14.4g %14.4g %8.3f %8.3f" % (
+            n, t_full, t_mb, inertia(M, labels), inertia(M, labels_mb),
+            adjusted_rand_score(truth, labels), adjusted_rand_score(truth, labels_mb)
+        ))
@@ -0,0 +1,56 @@
+"""
+    Benchmarks landmark MDS against the SMACOF based MDS.
+
+    Run as: python benchmarks/mds.py [n_landmarks]
+"""
+
+import sys
+import time
+import numpy as np
+from scipy.spatial.distance import pdist
+
+from DataAnalytics.distances import pairwise_distance
+from DataAnalytics.transform import MDS, landmark_MDS
+
+def timed(fn):
+    """
+        Returns the result of fn() and the time it took.
+
+        fn: Function to call.
+    """
+
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+def stress(X, Y):
+    """
+        Returns the normalized stress of an embedding, i.e. how badly it preserves distances.
+
+        X: Original elements, one per row.
+        Y: Embedded elements, one per row.
+    """
+
+    (DX, DY) = (pdist(X), pdist(Y))
+    return np.sqrt(np.sum((DX - DY) ** 2) / np.sum(DX ** 2))
+
+if __name__ == '__main__':
+    n_landmarks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rng = np.random.default_rng(42)
+
+    print("%8s %10s %10s %10s %10s" % ("n", "MDS", "landmark", "stress", "stress lm"))
+
+    for n in [500, 1000, 2000, 100000]:
+        # points near a 3 dimensional subspace
+        X = rng.standard_normal((n, 3)) @ rng.standard_normal((3, 20)) + 0.1 * rng.standard_normal((n, 20))
+
+        if n <= 2000:
+            (Y, t_mds) = timed(lambda: MDS(pairwise_distance(X, 'euclidean'), 3, seed=0))
+            s_mds = stress(X, Y)
+        else:
+            (t_mds, s_mds) = (float('nan'), float('nan'))
+
+        (Y, t_landmark) = timed(lambda: landmark_MDS(X, 3, n_landmarks=n_landmarks, seed=0))
+        sample = rng.choice(n, size=min(n, 2000), replace=False)
+
+        print("%8d %9.3fs %9.3fs %10.4f %10.4f" % (n, t_mds, t_landmark, s_mds, stress(X[sample], Y[sample])))
@@ -0,0 +1,56 @@
+"""
+    Benchmarks recall and latency of LSHIndex against exact search with order_by_distance.
+
+    Run as: python benchmarks/neighbours.py [number of vectors] [dimension]
+"""
+
+import sys
+import time
+import numpy as np
+
+from DataAnalytics.distances import order_by_distance
+from DataAnalytics.neighbours import LSHIndex
+
+def clustered_data(n, dim, n_clusters=100, seed=42):
+    """
+        Generates n vectors scattered around random cluster centers.
+
+        n: Number of vectors.
+        dim: Dimension of each vector.
+        n_clusters: Number of clusters.
+        seed: Random number generator seed to use.
+    """
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim))
+    return centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim))
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    k = 10
+
+    A = clustered_data(n, dim)
+
+    # queries are perturbed copies of indexed vectors
+    rng = np.random.default_rng(7)
+    queries = A[rng.integers(0, n, 50)] + 0.5 * rng.standard_normal((50, dim))
+
+    # exact neighbours
+    start = time.perf_counter()
+    exact = [set(order_by_distance(q, A, k=k)) for q in queries]
+    exact_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    print("%-30s recall %.3f %10.2f ms/query" % ("exact", 1.0, exact_ms))
+
+    for (n_bits, n_tables, n_probe) in [(16, 8, 0), (12, 8, 0), (12, 16, 4), (10, 16, 8), (8, 32, 8)]:
+        start = time.perf_counter()
+        index = LSHIndex(A, n_bits=n_bits, n_tables=n_tables, seed=0)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [set(index.query(q, k=k, n_probe=n_probe)[0]) for q in queries]
+        query_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+        recall = np.mean([len(f & e) / k for (f, e) in zip(found, exact)])
+        name = "lsh bits=%d tables=%d probe=%d" % (n_bits, n_tables, n_probe)
+        print("%-30s recall %.3f %10.2f ms/query (built in %.2fs)" % (name, recall, query_ms, build_s))
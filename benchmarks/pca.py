@@ -0,0 +1,59 @@
+"""
+    Benchmarks the exact and randomized PrincipalComponents against the old row-by-row projection.
+
+    Run as: python benchmarks/pca.py [n_components]
+"""
+
+import sys
+import time
+import numpy as np
+
+from DataAnalytics.transform import PrincipalComponents
+
+def timed(fn):
+    """
+        Returns the result of fn() and the time it took.
+
+        fn: Function to call.
+    """
+
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+def row_by_row(M):
+    """
+        Projects all rows of a matrix one at a time, like the old mlab based PCA did.
+
+        M: Matrix to project.
+    """
+
+    mean = M.mean(axis=0)
+    (_, _, Vh) = np.linalg.svd(M - mean, full_matrices=False)
+
+    P = np.array(M)
+    for r in range(P.shape[0]):
+        P[r, :] = np.dot(Vh, P[r, :] - mean)
+
+    return P
+
+if __name__ == '__main__':
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = np.random.default_rng(42)
+
+    print("%8s %6s %10s %10s %12s %14s" % ("n", "m", "rows", "exact", "randomized", "sv error"))
+
+    for (n, m) in [(10000, 200), (50000, 500), (100000, 1000)]:
+        # low rank data with noise
+        M = (rng.standard_normal((n, 2 * k)) * np.geomspace(100, 1, 2 * k)) @ rng.standard_normal((2 * k, m))
+        M += rng.standard_normal((n, m))
+
+        t_rows = timed(lambda: row_by_row(M))[1] if n <= 50000 else float('nan')
+        (exact, t_exact) = timed(lambda: PrincipalComponents(n_components=k, randomized=False).fit(M).transform(M))
+        (pca, t_randomized) = timed(lambda: PrincipalComponents(n_components=k, seed=0).fit(M))
+        t_randomized += timed(lambda: pca.transform(M))[1]
+
+        reference = PrincipalComponents(n_components=k, randomized=False).fit(M).singular_values
+        error = np.max(np.abs(pca.singular_values - reference)) / reference[0]
+
+        print("%8d %6d %9.3fs %9.3fs %11.3fs %14.2e" % (n, m, t_rows, t_exact, t_randomized, error))
@@ -0,0 +1,101 @@
+"""
+    Benchmarks the tokenizer against the original re.split / endswith implementation.
+
+    Run as: python benchmarks/tokenizer.py [number of documents]
+"""
+
+import re
+import sys
+import time
+import random
+
+from DataAnalytics.textual import words
+from DataAnalytics.textual.stopwords import STOP_WORDS
+
+# the original implementation of stemming and counting
+LEGACY_TERMINATORS = [",", ";", ".", ":", "?", "!", "-", "&", "(", ")"]
+
+def legacy_stem_word(word, cache={}):
+    if word in cache:
+        return cache[word]
+    original_word = word
+
+    word = word.lower().strip()
+
+    for t in LEGACY_TERMINATORS:
+        if word.endswith(t):
+            word = word[:-len(t)]
+
+    if word.endswith("s") and len(word) > 1:
+        if not word[-2] in ["a", "e", "i", "o", "u", "s"]:
+            word = word[:-1]
+
+    if word.endswith("es"):
+        word = word[:-1]
+
+    if word.endswith("ing"):
+        _word = word[:-3]
+        if _word != "th" and len(_word) > 1:
+            word = _word
+
+    if word.endswith("ed"):
+        if len(word) > 3:
+            word = word[:-2]
+
+    if word.endswith("ies") and (not word.endswith("eies") or not word.endswith("aies")):
+        word = word[:-3]+"y"
+
+    cache[original_word] = word
+    return word
+
+def legacy_stemmed_words(text):
+    text_words = re.split('(\\s+|[\\+\\-\\(\\)\\[\\]\\{\\}])', text)
+    return [w for w in map(legacy_stem_word, text_words) if not w in STOP_WORDS]
+
+def reference_corpus(n, seed=42):
+    """
+        Generates a reproducible corpus of n documents.
+
+        n: Number of documents to generate.
+        seed: Random number generator seed to use.
+    """
+
+    rng = random.Random(seed)
+
+    # a vocabulary of made up words with a few common suffixes
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    stems = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+    suffixes = ["", "", "", "s", "es", "ing", "ed", "ies"]
+    punctuation = ["", "", "", "", ",", ".", "?!", ";", ")", "-"]
+
+    def word():
+        if rng.random() < 0.3:
+            return rng.choice(STOP_WORDS)
+        w = rng.choice(stems) + rng.choice(suffixes) + rng.choice(punctuation)
+        return w.capitalize() if rng.random() < 0.1 else w
+
+    return [" ".join(word() for _ in range(rng.randint(50, 300))) for _ in range(n)]
+
+def measure(fn, corpus):
+    """
+        Returns the number of tokens fn produced and the time it took.
+
+        fn: Tokenizer to measure.
+        corpus: List of documents to tokenize.
+    """
+
+    start = time.perf_counter()
+    tokens = sum(len(fn(d)) for d in corpus)
+    return (tokens, time.perf_counter() - start)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = reference_corpus(n)
+
+    # both implementations need to agree
+    for d in corpus[:100]:
+        assert legacy_stemmed_words(d) == words.stemmed_words(d)
+
+    for (name, fn) in [("legacy", legacy_stemmed_words), ("tokenizer", words.stemmed_words)]:
+        (tokens, seconds) = measure(fn, corpus)
+        print("%-10s %10d tokens %8.3fs %12.0f tokens/s" % (name, tokens, seconds, tokens / seconds))
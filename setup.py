@@ -13,7 +13,7 @@ setup(
     license = "MIT",
     url = "https://github.com/tkw1536/DataAnalytics",
     packages=['DataAnalytics', 'DataAnalytics.textual'],
-    install_requires=('numpy', 'matplotlib', 'scipy', 'sklearn', 'networkx'),
+    install_requires=('numpy', 'matplotlib', 'scipy', 'sklearn', 'networkx', 'threadpoolctl'),
     long_description=read('README.md'),
     classifiers=[
         "License :: OSI Approved :: MIT License",